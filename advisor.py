@@ -0,0 +1,808 @@
+import argparse
+import ast
+import contextlib
+import copy
+import io
+from bisect import bisect_right
+from collections import namedtuple
+from pathlib import Path
+
+import astor
+
+from converter import export_notebook, find_cell_starts, scan_features, transform
+from multipage import bound_names, estimate_cost, used_names
+from tree_transformers import STREAMLIT_WIDGETS
+
+Finding = namedtuple(
+    "Finding",
+    [
+        "function",
+        "root",
+        "cell",
+        "line",
+        "kind",
+        "iterable",
+        "cost",
+        "advice",
+        "rewrite",
+    ],
+)
+
+ARRAY_MODULES = ["numpy", "scipy", "pandas"]
+UFUNCS = [
+    "abs",
+    "absolute",
+    "arccos",
+    "arcsin",
+    "arctan",
+    "arctan2",
+    "ceil",
+    "cos",
+    "cosh",
+    "exp",
+    "expm1",
+    "floor",
+    "hypot",
+    "log",
+    "log10",
+    "log1p",
+    "log2",
+    "maximum",
+    "minimum",
+    "sign",
+    "sin",
+    "sinh",
+    "sqrt",
+    "square",
+    "tan",
+    "tanh",
+]
+ARITHMETIC = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+STACKING = ["append", "concatenate", "vstack", "hstack"]
+# NumPy constructors that give a 1-D array for scalar arguments
+RANGES = ["arange", "geomspace", "linspace", "logspace"]
+FILLED = ["empty", "full", "ones", "zeros"]
+PLOT_METHODS = ["plot", "scatter", "bar", "fill_between", "text", "annotate"]
+COMPREHENSIONS = {
+    ast.ListComp: "list comprehension",
+    ast.SetComp: "set comprehension",
+    ast.GeneratorExp: "generator expression",
+    ast.DictComp: "dict comprehension",
+}
+
+
+def module_aliases(tree):
+    # Local names of imported modules, e.g. {"np": "numpy", "integrate": "scipy"}
+    aliases = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                aliases[alias.asname or alias.name.split(".")[0]] = alias.name
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            for alias in node.names:
+                aliases[alias.asname or alias.name] = node.module
+    return aliases
+
+
+def _root_name(node):
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _source(node):
+    return astor.to_source(node).strip()
+
+
+def _tolist(node):
+    return ast.Call(
+        func=ast.Attribute(value=node, attr="tolist", ctx=ast.Load()),
+        args=[],
+        keywords=[],
+    )
+
+
+def _walk_scope(node):
+    # ast.walk that does not enter nested functions and classes
+    nodes = list(ast.iter_child_nodes(node))
+    while nodes:
+        child = nodes.pop(0)
+        yield child
+        if not isinstance(
+            child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+        ):
+            nodes.extend(ast.iter_child_nodes(child))
+
+
+def reached_functions(tree):
+    # Functions that run again when a widget changes, mapped to the function
+    # called from the widget-dependent code that reaches them
+    functions = {
+        node.name: node
+        for node in ast.walk(tree)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    }
+    roots = {}
+
+    def add_calls(node, root=None):
+        for child in ast.walk(node):
+            if isinstance(child, ast.Call):
+                for name_node in [child.func] + child.args:
+                    name = name_node.id if isinstance(name_node, ast.Name) else None
+                    if name in functions and name not in roots:
+                        roots[name] = root or name
+                for keyword in child.keywords:
+                    if keyword.arg in ["on_click", "on_change"]:
+                        callback = keyword.value
+                        if isinstance(callback, ast.Name) and callback.id in functions:
+                            roots.setdefault(callback.id, callback.id)
+                        elif isinstance(callback, ast.Lambda):
+                            add_calls(callback.body, root)
+
+    # Everything downstream of a widget value reruns when the widget changes
+    tainted = set()
+    for statement in tree.body:
+        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        widget_calls = [
+            node
+            for node in ast.walk(statement)
+            if isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr in STREAMLIT_WIDGETS
+            and _root_name(node.func) == "st"
+        ]
+        if widget_calls or used_names(statement) & tainted:
+            tainted |= bound_names(statement)
+            add_calls(statement)
+
+    # Follow calls (and functions passed as arguments) from the roots
+    pending = list(roots)
+    while pending:
+        name = pending.pop()
+        before = set(roots)
+        for node in functions[name].body:
+            add_calls(node, roots[name])
+        pending.extend(set(roots) - before)
+    return {name: (functions[name], root) for name, root in roots.items()}
+
+
+class LoopAdvisor:
+    def __init__(self, tree, exported_code):
+        self.tree = tree
+        self.aliases = module_aliases(tree)
+        self.numpy = next(
+            (name for name, module in self.aliases.items() if module == "numpy"), None
+        )
+        self.math = next(
+            (name for name, module in self.aliases.items() if module == "math"), None
+        )
+        self.functions = {
+            node.name: node for node in tree.body if isinstance(node, ast.FunctionDef)
+        }
+        self.lines = exported_code.splitlines()
+        self.cell_starts = find_cell_starts(exported_code)
+
+    def location(self, lineno):
+        cell = bisect_right(self.cell_starts, lineno)
+        if not cell:
+            return None, lineno
+        first = self.cell_starts[cell - 1] + 1
+        while first < lineno and not self.lines[first - 1].strip():
+            first += 1
+        return cell, lineno - first + 1
+
+    def array_names(self, function, parameters=()):
+        arrays = set(parameters)
+        changed = True
+        while changed:
+            changed = False
+            for node in _walk_scope(function):
+                if not isinstance(node, ast.Assign) or not self.is_array(
+                    node.value, arrays
+                ):
+                    continue
+                for target in node.targets:
+                    elements = [target]
+                    if isinstance(target, ast.Tuple):
+                        elements = target.elts
+                    for element in elements:
+                        if isinstance(element, ast.Name) and element.id not in arrays:
+                            arrays.add(element.id)
+                            changed = True
+        return arrays
+
+    def is_array(self, node, arrays):
+        if isinstance(node, ast.Name):
+            return node.id in arrays
+        if isinstance(node, ast.Call):
+            module = self.aliases.get(_root_name(node.func), "")
+            return module.split(".")[0] in ARRAY_MODULES
+        if isinstance(node, (ast.Subscript, ast.Attribute)):
+            return self.is_array(node.value, arrays)
+        if isinstance(node, ast.BinOp):
+            return self.is_array(node.left, arrays) or self.is_array(node.right, arrays)
+        return False
+
+    def iterated_array(self, target, iterable, body, arrays):
+        # The array-like value a loop walks over, or None
+        if self.is_array(iterable, arrays):
+            return iterable
+        if not (
+            isinstance(iterable, ast.Call) and isinstance(iterable.func, ast.Name)
+        ):
+            return None
+        if iterable.func.id in ["zip", "enumerate"]:
+            return next((a for a in iterable.args if self.is_array(a, arrays)), None)
+        if iterable.func.id == "range" and isinstance(target, ast.Name):
+            # for i in range(n): ... a[i] ...
+            for node in body:
+                for child in ast.walk(node):
+                    if (
+                        isinstance(child, ast.Subscript)
+                        and self.is_array(child.value, arrays)
+                        and target.id in used_names(child.slice)
+                    ):
+                        return child.value
+        return None
+
+    def array_parameters(self, functions):
+        # Parameters that receive an array-like argument from the notebook's
+        # top level or from another reached function
+        parameters = {name: set() for name in functions}
+        changed = True
+        while changed:
+            changed = False
+            for caller in [self.tree, *functions.values()]:
+                arrays = self.array_names(
+                    caller, parameters.get(getattr(caller, "name", None), ())
+                )
+                for node in _walk_scope(caller):
+                    if not (
+                        isinstance(node, ast.Call)
+                        and isinstance(node.func, ast.Name)
+                        and node.func.id in functions
+                    ):
+                        continue
+                    called = functions[node.func.id].args
+                    names = [a.arg for a in called.posonlyargs + called.args]
+                    passed = list(zip(names, node.args))
+                    passed += [(kw.arg, kw.value) for kw in node.keywords if kw.arg]
+                    for name, value in passed:
+                        seen = parameters[node.func.id]
+                        if name not in seen and self.is_array(value, arrays):
+                            seen.add(name)
+                            changed = True
+        return parameters
+
+    def vector_parameters(self, functions):
+        # Parameters that receive a 1-D NumPy array at every call
+        parameters = {name: set() for name in functions}
+        changed = True
+        while changed:
+            passed = {}
+            for caller in [self.tree, *functions.values()]:
+                self.scalars = self.scalar_names(caller)
+                vectors = self.vector_names(
+                    caller, parameters.get(getattr(caller, "name", None), ())
+                )
+                for node in _walk_scope(caller):
+                    if not (
+                        isinstance(node, ast.Call)
+                        and isinstance(node.func, ast.Name)
+                        and node.func.id in functions
+                    ):
+                        continue
+                    called = functions[node.func.id].args
+                    names = [a.arg for a in called.posonlyargs + called.args]
+                    values = list(zip(names, node.args))
+                    values += [(kw.arg, kw.value) for kw in node.keywords if kw.arg]
+                    for name, value in values:
+                        passed.setdefault((node.func.id, name), []).append(
+                            self.is_vector(value, vectors)
+                        )
+            found = {name: set() for name in functions}
+            for (function, name), vector in passed.items():
+                if all(vector):
+                    found[function].add(name)
+            changed = found != parameters
+            parameters = found
+        return parameters
+
+    def advise(self, function, root, parameters=(), vector_parameters=()):
+        arrays = self.array_names(function, parameters)
+        parents = {}
+        for node in [function, *_walk_scope(function)]:
+            for child in ast.iter_child_nodes(node):
+                parents[child] = node
+        self.scalars = self.scalar_names(function)
+        self.vectors = self.vector_names(function, vector_parameters)
+
+        findings = []
+        for node in _walk_scope(function):
+            if isinstance(node, (ast.For, ast.AsyncFor)):
+                array = self.iterated_array(node.target, node.iter, node.body, arrays)
+                rewrite = self.batched_append(node)
+                if rewrite:
+                    advice = (
+                        "growing an array copies it on every iteration, collect "
+                        "the parts and join them once after the loop"
+                    )
+                elif array is None:
+                    continue
+                else:
+                    rewrite = self.append_loop(node, parents, array)
+                    advice = self.advice(node.body, [node.target], rewrite)
+                kind = "for loop"
+            elif type(node) in COMPREHENSIONS:
+                generator = node.generators[0]
+                array = self.iterated_array(
+                    generator.target, generator.iter, [node], arrays
+                )
+                if array is None:
+                    continue
+                kind = COMPREHENSIONS[type(node)]
+                rewrite = self.comprehension(node, parents)
+                advice = self.advice(
+                    [node], [g.target for g in node.generators], rewrite
+                )
+            else:
+                continue
+
+            cell, line = self.location(node.lineno)
+            findings.append(
+                Finding(
+                    function=function.name,
+                    root=root,
+                    cell=cell,
+                    line=line,
+                    kind=kind,
+                    iterable=_source(array) if array is not None else None,
+                    cost=estimate_cost([node], self.functions),
+                    advice=advice,
+                    rewrite=rewrite,
+                )
+            )
+        return findings
+
+    def advice(self, body, targets, rewrite):
+        if rewrite:
+            return (
+                "element-wise arithmetic, one NumPy expression over the whole "
+                "array computes the same values"
+            )
+        calls = [
+            child
+            for node in body
+            for child in ast.walk(node)
+            if isinstance(child, ast.Call)
+            and not self.elementwise(child)
+            and not (
+                isinstance(child.func, ast.Attribute)
+                and child.func.attr in ["append", "extend"]
+            )
+        ]
+        plots = [
+            call
+            for call in calls
+            if isinstance(call.func, ast.Attribute) and call.func.attr in PLOT_METHODS
+        ]
+        if plots:
+            return (
+                f"one {plots[0].func.attr}() call per element, draw all series "
+                "with a single call on 2-D arrays or a collection"
+            )
+        loop_vars = {
+            n.id
+            for target in targets
+            for n in ast.walk(target)
+            if isinstance(n, ast.Name)
+        }
+        for call in calls:
+            if any(used_names(arg) & loop_vars for arg in call.args):
+                return (
+                    f"{_source(call.func)}() runs once per element, check whether "
+                    "it accepts the whole array"
+                )
+        return "Python loop over an array, NumPy operations on whole arrays avoid it"
+
+    def scalar_names(self, function):
+        # Names that only ever hold a number: numeric defaults and constants
+        def numeric(node):
+            return (
+                node is not None
+                and all(
+                    isinstance(n, (ast.Constant, ast.UnaryOp, ast.BinOp))
+                    or isinstance(n, (ast.operator, ast.unaryop))
+                    for n in ast.walk(node)
+                )
+                and all(
+                    isinstance(n.value, (int, float, complex))
+                    for n in ast.walk(node)
+                    if isinstance(n, ast.Constant)
+                )
+            )
+
+        pairs = []
+        arguments = getattr(function, "args", None)
+        if arguments is not None:
+            positional = arguments.posonlyargs + arguments.args
+            defaults = [None] * (len(positional) - len(arguments.defaults))
+            defaults += arguments.defaults
+            pairs = list(zip(positional, defaults))
+            pairs += list(zip(arguments.kwonlyargs, arguments.kw_defaults))
+        assigned = {}
+        for node in _walk_scope(function):
+            for target in getattr(node, "targets", []):
+                if isinstance(target, ast.Name):
+                    assigned.setdefault(target.id, []).append(node.value)
+            if isinstance(node, (ast.AugAssign, ast.AnnAssign, ast.NamedExpr)):
+                if isinstance(node.target, ast.Name):
+                    assigned.setdefault(node.target.id, []).append(node.value)
+            if isinstance(node, (ast.For, ast.comprehension)):
+                for name in bound_names(getattr(node, "target", node)):
+                    assigned.setdefault(name, []).append(None)
+
+        scalars = set()
+        for argument, default in pairs:
+            if numeric(default) and all(map(numeric, assigned.get(argument.arg, []))):
+                scalars.add(argument.arg)
+        for name, values in assigned.items():
+            if all(map(numeric, values)):
+                scalars.add(name)
+        return scalars
+
+    def vector_names(self, function, parameters=()):
+        # Names only ever bound to a 1-D NumPy array, the only iterables whose
+        # elements a vectorized rewrite maps one to one. A DataFrame iterates
+        # its column labels, a 2-D array its rows.
+        # parameters receive a 1-D array at every call
+        parameter = object()
+        assigned = {name: [parameter] for name in parameters}
+        for node in _walk_scope(function):
+            values = []
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    value = node.value if isinstance(target, ast.Name) else None
+                    values += [(target, value)]
+            elif isinstance(node, (ast.AugAssign, ast.AnnAssign, ast.NamedExpr)):
+                values = [(node.target, None)]
+            elif isinstance(node, (ast.For, ast.AsyncFor, ast.comprehension)):
+                values = [(node.target, None)]
+            elif isinstance(node, ast.withitem) and node.optional_vars:
+                values = [(node.optional_vars, None)]
+            elif isinstance(node, (ast.Global, ast.Nonlocal)):
+                values = [(ast.Name(id=name), None) for name in node.names]
+            for target, value in values:
+                for name in ast.walk(target):
+                    if isinstance(name, ast.Name):
+                        assigned.setdefault(name.id, []).append(value)
+        vectors = set()
+        changed = True
+        while changed:
+            changed = False
+            for name, values in assigned.items():
+                if name not in vectors and all(
+                    value is parameter or self.is_vector(value, vectors)
+                    for value in values
+                ):
+                    vectors.add(name)
+                    changed = True
+        return vectors
+
+    def is_vector(self, node, vectors):
+        if isinstance(node, ast.Name):
+            return node.id in vectors
+        if isinstance(node, ast.BinOp):
+            sides = [node.left, node.right]
+            return (
+                isinstance(node.op, ARITHMETIC)
+                and any(self.is_vector(side, vectors) for side in sides)
+                and all(
+                    self.is_vector(side, vectors) or self.is_number(side)
+                    for side in sides
+                )
+            )
+        if isinstance(node, ast.UnaryOp):
+            return isinstance(node.op, (ast.USub, ast.UAdd)) and self.is_vector(
+                node.operand, vectors
+            )
+        if not isinstance(node, ast.Call):
+            return False
+        if isinstance(node.func, ast.Name):
+            return node.func.id == "range"
+        if not (
+            isinstance(node.func.value, ast.Name) and node.func.value.id == self.numpy
+        ):
+            return False
+        if node.func.attr in RANGES:
+            return bool(node.args) and all(map(self.is_number, node.args[:2]))
+        if node.func.attr in FILLED:
+            return bool(node.args) and self.is_number(node.args[0])
+        if node.func.attr in UFUNCS and not node.keywords:
+            return any(self.is_vector(arg, vectors) for arg in node.args) and all(
+                self.is_vector(arg, vectors) or self.is_number(arg)
+                for arg in node.args
+            )
+        return False
+
+    def is_number(self, node):
+        if isinstance(node, ast.UnaryOp):
+            node = node.operand
+        if isinstance(node, ast.Constant):
+            return isinstance(node.value, (int, float)) and not isinstance(
+                node.value, bool
+            )
+        return isinstance(node, ast.Name) and node.id in self.scalars
+
+    def elementwise(self, node):
+        # Arithmetic and ufuncs that map each element on its own
+        if isinstance(node, ast.Constant):
+            return isinstance(node.value, (int, float, complex)) and not isinstance(
+                node.value, bool
+            )
+        if isinstance(node, ast.Name):
+            return True
+        if isinstance(node, ast.BinOp):
+            return (
+                isinstance(node.op, ARITHMETIC)
+                and self.elementwise(node.left)
+                and self.elementwise(node.right)
+            )
+        if isinstance(node, ast.UnaryOp):
+            return isinstance(node.op, (ast.USub, ast.UAdd)) and self.elementwise(
+                node.operand
+            )
+        if isinstance(node, ast.Call):
+            return (
+                isinstance(node.func, ast.Attribute)
+                and isinstance(node.func.value, ast.Name)
+                and node.func.value.id in [self.numpy, self.math]
+                and node.func.attr in UFUNCS
+                and not node.keywords
+                and all(self.elementwise(arg) for arg in node.args)
+            )
+        return False
+
+    def vectorized(self, element, variable, array):
+        # element with the loop variable replaced by the whole array
+        if isinstance(array, ast.Call) and _root_name(array.func) == self.numpy:
+            whole = array
+        else:
+            whole = ast.Call(
+                func=ast.Attribute(
+                    value=ast.Name(id=self.numpy, ctx=ast.Load()),
+                    attr="asarray",
+                    ctx=ast.Load(),
+                ),
+                args=[array],
+                keywords=[],
+            )
+        element = copy.deepcopy(element)
+        for node in ast.walk(element):
+            if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+                if node.value.id == self.math:
+                    node.value.id = self.numpy
+            for field, value in ast.iter_fields(node):
+                if isinstance(value, ast.Name) and value.id == variable:
+                    setattr(node, field, whole)
+                elif isinstance(value, list):
+                    value[:] = [
+                        whole if isinstance(v, ast.Name) and v.id == variable else v
+                        for v in value
+                    ]
+        return element
+
+    def assumptions(self, element, variable):
+        names = used_names(element) - {variable, self.numpy, self.math}
+        unproven = sorted(names - self.scalars)
+        note = ""
+        if unproven:
+            verb = "is a scalar" if len(unproven) == 1 else "are scalars"
+            note += f"\n# assumes {', '.join(unproven)} {verb}"
+        if any(isinstance(node, ast.Call) for node in ast.walk(element)):
+            note += "\n# NumPy's functions may round the last digit differently"
+        return note
+
+    def _vectorizable(self, element, target, array):
+        return (
+            self.numpy
+            and array is not None
+            and self.is_vector(array, self.vectors)
+            and isinstance(target, ast.Name)
+            and target.id in used_names(element)
+            and self.elementwise(element)
+        )
+
+    def comprehension(self, node, parents):
+        generator = node.generators[0]
+        if (
+            not isinstance(node, ast.ListComp)
+            or len(node.generators) != 1
+            or generator.ifs
+            or generator.is_async
+            or not self._vectorizable(node.elt, generator.target, generator.iter)
+        ):
+            return None
+        result = self.vectorized(node.elt, generator.target.id, generator.iter)
+        note = self.assumptions(node.elt, generator.target.id)
+        parent = parents.get(node)
+        if (
+            isinstance(parent, ast.Call)
+            and _root_name(parent.func) == self.numpy
+            and isinstance(parent.func, ast.Attribute)
+            and parent.func.attr in ["array", "asarray"]
+            and parent.args == [node]
+            and not parent.keywords
+        ):
+            return f"{_source(parent)}\n-> {_source(result)}{note}"
+        return f"{_source(node)}\n-> {_source(_tolist(result))}{note}"
+
+    def append_loop(self, node, parents, array):
+        # out = []; for x in a: out.append(f(x))
+        if len(node.body) != 1 or node.orelse or array is not node.iter:
+            return None
+        statement = node.body[0]
+        if not (
+            isinstance(statement, ast.Expr)
+            and isinstance(statement.value, ast.Call)
+            and isinstance(statement.value.func, ast.Attribute)
+            and statement.value.func.attr == "append"
+            and isinstance(statement.value.func.value, ast.Name)
+            and len(statement.value.args) == 1
+        ):
+            return None
+        out = statement.value.func.value.id
+        element = statement.value.args[0]
+        if out == getattr(node.target, "id", None) or not self._vectorizable(
+            element, node.target, array
+        ):
+            return None
+
+        result = _tolist(self.vectorized(element, node.target.id, node.iter))
+        note = self.assumptions(element, node.target.id)
+        body = getattr(parents.get(node), "body", [])
+        index = next((i for i, s in enumerate(body) if s is node), None)
+        previous = body[index - 1] if index else None
+        if (
+            isinstance(previous, ast.Assign)
+            and len(previous.targets) == 1
+            and isinstance(previous.targets[0], ast.Name)
+            and previous.targets[0].id == out
+            and isinstance(previous.value, ast.List)
+            and not previous.value.elts
+        ):
+            original = f"{_source(previous)}\n{_source(node)}"
+            return f"{original}\n-> {out} = {_source(result)}{note}"
+        return f"{_source(node)}\n-> {out}.extend({_source(result)}){note}"
+
+    def batched_append(self, node):
+        # acc = np.append(acc, v) copies acc on every iteration
+        if not self.numpy:
+            return None
+        for index, statement in enumerate(node.body):
+            if not (
+                isinstance(statement, ast.Assign)
+                and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name)
+                and isinstance(statement.value, ast.Call)
+                and isinstance(statement.value.func, ast.Attribute)
+                and _root_name(statement.value.func) == self.numpy
+                and statement.value.func.attr in STACKING
+            ):
+                continue
+            accumulator = statement.targets[0].id
+            call = statement.value
+            keywords = {kw.arg: kw.value for kw in call.keywords}
+            if call.func.attr == "append":
+                if len(call.args) != 2 or set(keywords) - {"axis"}:
+                    continue
+                first, value = call.args
+            else:
+                if (
+                    len(call.args) != 1
+                    or not isinstance(call.args[0], (ast.Tuple, ast.List))
+                    or len(call.args[0].elts) != 2
+                    or set(keywords) - {"axis"}
+                ):
+                    continue
+                first, value = call.args[0].elts
+            mentions = sum(
+                isinstance(n, ast.Name) and n.id == accumulator
+                for child in node.body
+                for n in ast.walk(child)
+            )
+            if not (isinstance(first, ast.Name) and first.id == accumulator):
+                continue
+            # Anything else reading or writing acc needs the running array
+            if mentions != 2 or accumulator in used_names(value):
+                continue
+
+            parts = f"{accumulator}_parts"
+            loop = copy.deepcopy(node)
+            loop.body[index] = ast.Expr(
+                value=ast.Call(
+                    func=ast.Attribute(
+                        value=ast.Name(id=parts, ctx=ast.Load()),
+                        attr="append",
+                        ctx=ast.Load(),
+                    ),
+                    args=[value],
+                    keywords=[],
+                )
+            )
+            np = self.numpy
+            if call.func.attr == "append" and "axis" not in keywords:
+                combine = f"{np}.concatenate([{np}.ravel(p) for p in {parts}])"
+            elif call.func.attr in ["append", "concatenate"]:
+                axis = _source(keywords["axis"]) if "axis" in keywords else "0"
+                combine = f"{np}.concatenate({parts}, axis={axis})"
+            else:
+                combine = f"{np}.{call.func.attr}({parts})"
+            return (
+                f"{_source(node)}\n->\n{parts} = [{accumulator}]\n{_source(loop)}\n"
+                f"{accumulator} = {combine}"
+            )
+        return None
+
+
+def advise(tree, exported_code):
+    advisor = LoopAdvisor(tree, exported_code)
+    reached = reached_functions(tree)
+    parameters = advisor.array_parameters(
+        {name: function for name, (function, _) in reached.items()}
+    )
+    vectors = advisor.vector_parameters(
+        {name: function for name, (function, _) in reached.items()}
+    )
+    findings = []
+    for name, (function, root) in reached.items():
+        findings.extend(
+            advisor.advise(function, root, parameters[name], vectors[name])
+        )
+    return sorted(findings, key=lambda finding: -finding.cost)
+
+
+def advise_notebook(input_code):
+    exported_code = export_notebook(input_code)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tree = transform(exported_code, features=scan_features(exported_code))
+    return advise(tree, exported_code)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find Python loops over arrays that rerun on widget changes"
+    )
+    parser.add_argument("notebook")
+    parser.add_argument(
+        "--min-cost", type=int, default=0, help="Hide loops estimated cheaper"
+    )
+    args = parser.parse_args()
+
+    findings = advise_notebook(Path(args.notebook).read_text())
+    findings = [finding for finding in findings if finding.cost >= args.min_cost]
+    if not findings:
+        print("No loops over arrays in code that reruns on widget changes")
+    for finding in findings:
+        location = f"line {finding.line}"
+        if finding.cell:
+            location = f"cell {finding.cell}, {location}"
+        reached = (
+            f" (called from {finding.root})" if finding.root != finding.function else ""
+        )
+        over = f" over {finding.iterable}" if finding.iterable else ""
+        print(
+            f"{location}: {finding.kind}{over} in {finding.function}(){reached}, "
+            f"estimated cost {finding.cost}"
+        )
+        print(f"    {finding.advice}")
+        if finding.rewrite:
+            print("    suggested rewrite:")
+            for line in finding.rewrite.splitlines():
+                print(f"        {line}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
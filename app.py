@@ -1,81 +1,108 @@
-import ast
-import astor
-from io import StringIO
-from collections import defaultdict
 import re
-from nbconvert import PythonExporter
-import tempfile
-import subprocess
 from pathlib import Path
 
 import streamlit as st
-from tree_transformers import IpywidgetsToStreamlitTransformer
+from converter import CellResult, convert_stream
+from multipage import convert_to_pages
 
 
-def remove_unused_imports(code_string):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_file = Path(temp_dir) / "temp.py"
-        with open(temp_file, 'w') as f:
-            f.write(code_string)
-
-        # Run autoflake to remove unused imports
-        autoflake_command = f"autoflake --remove-all-unused-imports --remove-duplicate-keys --in-place {temp_file}"
-        subprocess.run(autoflake_command.split())
-
-        # Read the cleaned code
-        with open(temp_file, 'r') as f:
-            cleaned_code = f.read()
-
-    return cleaned_code
-
-
-def remove_duplicate_imports(tree):
-    imports = defaultdict(set)
-
-    # Collect all unique imports
-    new_body = []
-    for node in tree.body:
-        if isinstance(node, (ast.Import, ast.ImportFrom)):
-            module = node.module if isinstance(node, ast.ImportFrom) else None
-            for name in node.names:
-                alias = (module, name.name, name.asname)
-                if alias not in imports[module]:
-                    imports[module].add(alias)
-                    new_body.append(node)
-        else:
-            new_body.append(node)
-
-    # Update the tree with the new body and unparse it
-    tree.body = new_body
-
-    return tree
-
-
-def convert(input_code: str) -> str:
-    python_exporter = PythonExporter()
-    exported_code, _ = python_exporter.from_file(StringIO(input_code))
-    exported_code = re.sub(r"[#%].*", "", exported_code)
-    tree = ast.parse(exported_code, "", "exec")
-    transformer = IpywidgetsToStreamlitTransformer()
-    output_ast = transformer.visit(tree)
-    output_code = astor.to_source(remove_duplicate_imports(output_ast))
-    clean_code = remove_unused_imports(output_code)
-    return clean_code
+def write_pages(files):
+    # Drop pages from the previous conversion so stale sections do not linger
+    for old_page in Path("pages").glob("output*.py"):
+        old_page.unlink()
+    for name, code in files.items():
+        with open(Path("pages") / name, "w") as f:
+            f.write(code)
 
 
 st.title("Ipython ➡️ Streamlit converter")
 
 uploader = st.file_uploader("Upload *.ipynb file", type="ipynb")
+downsample_plots = st.checkbox(
+    "Downsample large plot series",
+    help="Route large arrays passed to plot/scatter through min/max decimation",
+)
+profile = st.checkbox(
+    "Add profiling instrumentation",
+    help="Time cells and functions, shown in a sidebar panel of the generated app",
+)
+resize_images = st.checkbox(
+    "Resize images on the server",
+    help="Serve Image widgets at their width/height through a cached resize",
+)
+warm_up = st.checkbox(
+    "Add a cache warm-up stage",
+    help="Cache interactive functions and let warm_up.py fill the caches at deploy",
+)
+native_charts = st.checkbox(
+    "Draw simple plots as native charts",
+    help="Line, scatter and bar figures are drawn by the browser, not rasterised",
+)
+figure_objects = st.checkbox(
+    "Draw figures without pyplot",
+    help="Every figure is a Figure object of its own, safe for concurrent sessions",
+)
+split_pages = st.checkbox(
+    "Split into multiple pages",
+    help="One page per markdown heading, earlier setup is shared through a cache",
+)
 
 if uploader:
     input_code = uploader.getvalue().decode("utf-8")
     with st.expander("Input code"):
         st.code(input_code, language="python", line_numbers=True)
-    output_code = convert(input_code)
-    with st.expander("Output code"):
-        st.code(output_code, language="python", line_numbers=True)
-    with open("pages/output.py", "w") as f:
-        f.write(output_code)
-
-
-
+    if split_pages:
+        pages = convert_to_pages(
+            input_code,
+            downsample_plots=downsample_plots,
+            profile=profile,
+            resize_images=resize_images,
+            warm_up=warm_up,
+            native_charts=native_charts,
+            figure_objects=figure_objects,
+        )
+        st.table(
+            [
+                {
+                    "page": page.title,
+                    "statements per rerun": page.statement_count,
+                    "estimated rerun cost": page.rerun_cost,
+                }
+                for page in pages
+            ]
+        )
+        files = {}
+        for number, page in enumerate(pages, start=1):
+            slug = re.sub(r"\W+", "_", page.title.lower()).strip("_")
+            files[f"output_{number:02d}_{slug}.py"] = page.code
+            with st.expander(f"Output code: {page.title}"):
+                st.code(page.code, language="python", line_numbers=True)
+        write_pages(files)
+    else:
+        # Cells show up as they are converted, the finished app replaces them
+        progress = st.empty()
+        cells = st.expander("Converted cells", expanded=True)
+        for result in convert_stream(
+            input_code,
+            downsample_plots=downsample_plots,
+            profile=profile,
+            resize_images=resize_images,
+            warm_up=warm_up,
+            native_charts=native_charts,
+            figure_objects=figure_objects,
+        ):
+            if isinstance(result, CellResult):
+                progress.caption(f"Converted cell {result.cell}")
+                for line in result.diagnostics:
+                    print(line)
+                    # Parts of the cell that were left as they are
+                    if line.startswith("Warning:"):
+                        cells.warning(f"Cell {result.cell}: {line[9:].strip()}")
+                cells.code(result.code, language="python")
+        progress.caption(
+            f"First cell after {result.first_output_seconds:.2f} s, "
+            f"app after {result.seconds:.2f} s"
+        )
+        with st.expander("Output code"):
+            st.code(result.code, language="python", line_numbers=True)
+        write_pages({"output.py": result.code})
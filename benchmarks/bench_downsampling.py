@@ -0,0 +1,72 @@
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+from PIL import Image, ImageChops  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from converter_runtime.downsampling import downsample  # noqa: E402
+
+
+def render(x, y):
+    fig = plt.figure()
+    ax = fig.add_subplot()
+    ax.plot(x, y, "-", linewidth=1)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    plt.close(fig)
+    return Image.open(buffer).convert("RGB")
+
+
+def timed_render(x, y, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        image = render(x, y)
+        best = min(best, time.perf_counter() - start)
+    return best, image
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare render latency and output of full vs downsampled plots"
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(
+        f"{'points':>10} {'full ms':>10} {'down ms':>10} "
+        f"{'speedup':>8} {'diff px':>8}"
+    )
+    for size in args.sizes:
+        x = np.linspace(0, 100, size)
+        y = np.cumsum(rng.standard_normal(size))
+
+        full_time, full_image = timed_render(x, y, args.repeat)
+        start = time.perf_counter()
+        down_x, down_y = downsample(x, y)
+        decimate_time = time.perf_counter() - start
+        down_time, down_image = timed_render(down_x, down_y, args.repeat)
+        down_time += decimate_time
+
+        diff = np.asarray(ImageChops.difference(full_image, down_image))
+        changed = np.count_nonzero(diff.max(axis=2) > 32) / diff[..., 0].size
+        print(
+            f"{size:>10} {full_time * 1000:>10.1f} {down_time * 1000:>10.1f} "
+            f"{full_time / down_time:>7.1f}x {changed:>7.2%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import nbformat
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+import matplotlib  # noqa: E402
+
+# The pyplot app never closes its figures
+matplotlib.rcParams["figure.max_open_warning"] = 0
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from converter import convert  # noqa: E402
+
+VALUES = 8
+
+NOTEBOOK = [
+    "import numpy as np\n"
+    "import matplotlib.pyplot as plt\n"
+    "import ipywidgets as widgets",
+    "k = widgets.IntSlider(value=1, min=1, max=8)",
+    "x = np.linspace(0, 10, {points})",
+    "fig = plt.figure(figsize=(4, 3))\n"
+    "plt.plot(x, np.sin(k.value * x))\n"
+    "plt.title(f'k = {{k.value}}')\n"
+    "plt.xlabel('x')\n"
+    "plt.show()",
+    "fig, ax = plt.subplots(figsize=(4, 3))\n"
+    "ax.bar(['a', 'b', 'c'], [k.value, 2, 3])\n"
+    "plt.ylabel('count')\n"
+    "plt.show()",
+]
+
+
+class SessionStreamlit(types.ModuleType):
+    # One streamlit module for every thread, each thread is a session with its
+    # own slider value and the PNG digests of the figures it showed
+    def __init__(self):
+        super().__init__("streamlit")
+        self.session = threading.local()
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+    def slider(self, *args, **kwargs):
+        return self.session.value
+
+    def pyplot(self, fig=None, **kwargs):
+        import matplotlib.pyplot as plt
+
+        image = io.BytesIO()
+        (fig or plt).savefig(image, format="png")
+        self.session.images.append(hashlib.sha256(image.getvalue()).hexdigest())
+
+
+def rerun(code, st, value, lock=None):
+    st.session.value = value
+    st.session.images = []
+    with lock or contextlib.nullcontext():
+        exec(code, {"__name__": "__main__"})
+    return st.session.images
+
+
+def stress(code, st, threads, reruns, expected, lock=None):
+    def session(number):
+        wrong = errors = 0
+        for step in range(reruns):
+            value = (number + step) % VALUES + 1
+            try:
+                images = rerun(code, st, value, lock)
+            except Exception:
+                errors += 1
+                continue
+            wrong += images != expected[value]
+        return wrong, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(session, range(threads)))
+    seconds = time.perf_counter() - start
+    return (
+        threads * reruns / seconds,
+        sum(wrong for wrong, _ in results),
+        sum(errors for _, errors in results),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rerun a plotting app on many threads at once and check that "
+        "every session gets its own figures"
+    )
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--reruns", type=int, default=20, help="Per thread")
+    parser.add_argument("--points", type=int, default=1000)
+    args = parser.parse_args()
+
+    cells = [cell.format(points=args.points) for cell in NOTEBOOK]
+    notebook = nbformat.writes(
+        nbformat.v4.new_notebook(
+            cells=[nbformat.v4.new_code_cell(cell) for cell in cells]
+        )
+    )
+    st = SessionStreamlit()
+    sys.modules["streamlit"] = st
+    modes = {}
+    for figure_objects in [False, True]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            code = convert(notebook, figure_objects=figure_objects)
+        modes[figure_objects] = compile(code, "app.py", "exec")
+
+    print(
+        f"{'mode':<22}{'threads':>8}{'reruns/s':>10}{'wrong':>7}{'errors':>8}"
+    )
+    lock = threading.Lock()
+    failed = False
+    for name, figure_objects, session_lock in [
+        ("pyplot", False, None),
+        ("pyplot + lock", False, lock),
+        ("Figure objects", True, None),
+    ]:
+        code = modes[figure_objects]
+        # Single-threaded reference images for every slider value
+        expected = {
+            value: rerun(code, st, value) for value in range(1, VALUES + 1)
+        }
+        for threads in args.threads:
+            throughput, wrong, errors = stress(
+                code, st, threads, args.reruns, expected, session_lock
+            )
+            print(f"{name:<22}{threads:>8}{throughput:>10.1f}{wrong:>7}{errors:>8}")
+            # Shared pyplot state is expected to go wrong, Figure objects not
+            failed |= figure_objects and bool(wrong or errors)
+    if failed:
+        print("Figure objects showed a wrong image or failed", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
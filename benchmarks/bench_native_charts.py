@@ -0,0 +1,87 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import nbformat
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from converter import convert  # noqa: E402
+from simulate import SimulatedStreamlit, Simulator  # noqa: E402
+
+
+def make_notebook(points, figures):
+    cells = [
+        "import numpy as np\n"
+        "import matplotlib.pyplot as plt\n"
+        "import ipywidgets as widgets",
+        f"x = np.linspace(0, 10, {points})",
+    ]
+    for i in range(figures):
+        cells += [
+            "fig = plt.figure()\n"
+            f"plt.plot(x, np.sin(x + {i}), label='sin')\n"
+            f"plt.plot(x, np.cos(x + {i}), label='cos')\n"
+            "plt.title('Waves')\nplt.xlabel('t')\nplt.legend()\nplt.show()",
+            "fig, ax = plt.subplots()\n"
+            f"ax.scatter(x, np.sin(x * {i + 1}))\nax.set_ylabel('y')\nplt.show()",
+            "fig = plt.figure()\n"
+            f"plt.bar(['a', 'b', 'c', 'd'], [{i}, 3, 1, 2])\nplt.show()",
+        ]
+    notebook = nbformat.v4.new_notebook(
+        cells=[nbformat.v4.new_code_cell(cell) for cell in cells]
+    )
+    return nbformat.writes(notebook)
+
+
+def cpu_per_rerun(path, reruns):
+    # st.pyplot rasterises to PNG, st.altair_chart builds the Vega-Lite spec
+    simulator = Simulator(path, trace_memory=False)
+    sys.modules["streamlit"] = simulator.st = SimulatedStreamlit()
+    result = simulator.rerun("first")
+    start = time.process_time()
+    for step in range(reruns):
+        result = simulator.rerun(step)
+    if result.error:
+        raise RuntimeError(f"{path.name}: {result.error}")
+    return (time.process_time() - start) / reruns, result.figures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare server CPU per rerun of st.pyplot and native charts"
+    )
+    parser.add_argument("--points", type=int, nargs="+", default=[100, 1000, 4000])
+    parser.add_argument(
+        "--figures", type=int, default=3, help="Line, scatter and bar figures each"
+    )
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{'points':>8} {'pyplot ms':>10} {'native ms':>10} "
+        f"{'speedup':>8} {'figures':>9}"
+    )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for points in args.points:
+            notebook = make_notebook(points, args.figures)
+            timings = []
+            for native_charts in [False, True]:
+                path = Path(temp_dir) / f"app_{points}_{native_charts}.py"
+                with contextlib.redirect_stdout(io.StringIO()):
+                    path.write_text(convert(notebook, native_charts=native_charts))
+                timings.append(cpu_per_rerun(path, args.reruns))
+            (pyplot, pyplot_figures), (native, native_figures) = timings
+            print(
+                f"{points:>8} {pyplot * 1000:>10.1f} {native * 1000:>10.1f} "
+                f"{pyplot / native:>7.1f}x {pyplot_figures:>4} ->{native_figures:>2}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import ast
+import contextlib
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from converter import export_notebook, scan_features, transform  # noqa: E402
+
+
+def timed_transform(exported_code, features, workers, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            tree = transform(exported_code, features=features, workers=workers)
+            best = min(best, time.perf_counter() - start)
+    return best, ast.dump(tree, include_attributes=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Transform time of the sharded transformer by worker count"
+    )
+    parser.add_argument("notebook", help="A large *.ipynb file")
+    parser.add_argument(
+        "--copies", type=int, default=1, help="Repeat the notebook's cells N times"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, 2, 4, os.cpu_count() or 1}),
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    exported_code = export_notebook(Path(args.notebook).read_text())
+    exported_code = "\n".join([exported_code] * args.copies)
+    features = scan_features(exported_code)
+    print(
+        f"{len(exported_code.splitlines())} lines, {os.cpu_count()} cores\n"
+        f"{'workers':>8} {'ms':>10} {'speedup':>8} {'identical':>10}"
+    )
+    serial_time, serial_tree = timed_transform(
+        exported_code, features, 1, args.repeat
+    )
+    for workers in args.workers:
+        if workers == 1:
+            elapsed, tree = serial_time, serial_tree
+        else:
+            elapsed, tree = timed_transform(
+                exported_code, features, workers, args.repeat
+            )
+        print(
+            f"{workers:>8} {elapsed * 1000:>10.1f} {serial_time / elapsed:>7.2f}x "
+            f"{str(tree == serial_tree):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from converter import export_notebook, scan_features  # noqa: E402
+from tree_transformers import (  # noqa: E402
+    FEATURE_NAMES,
+    IpywidgetsToStreamlitTransformer,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report how often the pre-scan lets conversion passes be skipped"
+    )
+    parser.add_argument("corpus", help="Directory searched for *.ipynb files")
+    args = parser.parse_args()
+
+    notebooks = sorted(Path(args.corpus).rglob("*.ipynb"))
+    if not notebooks:
+        parser.error(f"No notebooks found in {args.corpus}")
+
+    scanned = []
+    scan_time = 0.0
+    for notebook in notebooks:
+        try:
+            exported_code = export_notebook(notebook.read_text())
+        except Exception as e:
+            # One invalid notebook should not end the whole run
+            message = str(e).splitlines()[0]
+            print(f"Warning: skipping {notebook.name}: {message}", file=sys.stderr)
+            continue
+        start = time.perf_counter()
+        scanned.append(scan_features(exported_code))
+        scan_time += time.perf_counter() - start
+
+    def skip_rate(applies):
+        skipped = sum(1 for features in scanned if not applies(features))
+        return f"{skipped / len(scanned):7.1%}"
+
+    if not scanned:
+        parser.error(f"No notebook in {args.corpus} could be exported")
+    mean_scan = scan_time * 1000 / len(scanned)
+    print(f"{len(scanned)} notebooks, mean scan {mean_scan:.2f} ms")
+    print("\nfeature absent")
+    for feature in FEATURE_NAMES:
+        print(f"  {feature:<28}{skip_rate(lambda f: feature in f)}")
+
+    print("\nvisitor skipped")
+    for visitor, required in IpywidgetsToStreamlitTransformer.visitor_features.items():
+        print(f"  {visitor:<28}{skip_rate(lambda f: required & f)}")
+
+    print("\npass skipped")
+    passes = {
+        "whole transformer": lambda f: f & set(FEATURE_NAMES),
+        "plot downsampling": lambda f: "plotting" in f,
+        "duplicate imports": lambda f: "imports" in f,
+        "autoflake": lambda f: f & {"imports", "dict_literals", "pass"},
+    }
+    for name, applies in passes.items():
+        print(f"  {name:<28}{skip_rate(applies)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import contextlib
+import io
+import statistics
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from converter import CellResult, convert_stream  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare time to the first converted cell with the whole convert"
+    )
+    parser.add_argument("corpus", help="Directory searched for *.ipynb files")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    notebooks = sorted(Path(args.corpus).rglob("*.ipynb"))
+    if not notebooks:
+        parser.error(f"No notebooks found in {args.corpus}")
+
+    print(f"{'notebook':<32}{'cells':>7}{'first cell':>12}{'total':>10}")
+    ratios = []
+    for notebook in notebooks:
+        cells = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for result in convert_stream(notebook.read_text(), workers=args.workers):
+                if isinstance(result, CellResult):
+                    cells += 1
+        ratios.append(result.first_output_seconds / result.seconds)
+        print(
+            f"{notebook.name[:31]:<32}{cells:>7}"
+            f"{result.first_output_seconds * 1000:>10.0f}ms"
+            f"{result.seconds * 1000:>8.0f}ms"
+        )
+    print(f"\nmedian first cell at {statistics.median(ratios):.1%} of the total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import ast
+import astor
+import contextlib
+import copy
+from io import StringIO
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+import re
+from nbconvert import PythonExporter
+import tempfile
+import subprocess
+import time
+import tokenize
+from pathlib import Path
+
+from parallel import transform_parallel
+from tree_transformers import (
+    FEATURE_NAMES,
+    STREAMLIT_IMPORT,
+    FigureObjectTransformer,
+    IpywidgetsToStreamlitTransformer,
+    NativeChartTransformer,
+    PlotDownsamplingTransformer,
+    ProfilingTransformer,
+    WarmUpTransformer,
+)
+
+CELL_PATTERN = re.compile(r"^# In\[.*\]:")
+
+CellResult = namedtuple("CellResult", ["cell", "code", "diagnostics"])
+Conversion = namedtuple(
+    "Conversion", ["code", "diagnostics", "first_output_seconds", "seconds"]
+)
+
+
+def remove_unused_imports(code_string):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_file = Path(temp_dir) / "temp.py"
+        with open(temp_file, 'w') as f:
+            f.write(code_string)
+
+        # Run autoflake to remove unused imports
+        autoflake_command = f"autoflake --remove-all-unused-imports --remove-duplicate-keys --in-place {temp_file}"
+        subprocess.run(autoflake_command.split())
+
+        # Read the cleaned code
+        with open(temp_file, 'r') as f:
+            cleaned_code = f.read()
+
+    return cleaned_code
+
+
+def remove_duplicate_imports(tree):
+    imports = defaultdict(set)
+
+    # Collect all unique imports
+    new_body = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            module = node.module if isinstance(node, ast.ImportFrom) else None
+            for name in node.names:
+                alias = (module, name.name, name.asname)
+                if alias not in imports[module]:
+                    imports[module].add(alias)
+                    new_body.append(node)
+        else:
+            new_body.append(node)
+
+    # Update the tree with the new body and unparse it
+    tree.body = new_body
+
+    return tree
+
+
+def add_runtime_imports(tree, runtime_imports):
+    for module, name in sorted(runtime_imports, reverse=True):
+        if (module, name) == STREAMLIT_IMPORT:
+            if not imports_streamlit(tree):
+                alias = ast.alias(name=module, asname=name)
+                tree.body.insert(0, ast.Import(names=[alias]))
+            continue
+        tree.body.insert(
+            0, ast.ImportFrom(module=module, names=[ast.alias(name=name)], level=0)
+        )
+    return tree
+
+
+def imports_streamlit(tree):
+    return any(
+        isinstance(statement, ast.Import)
+        and any(
+            alias.name == "streamlit" and alias.asname == "st"
+            for alias in statement.names
+        )
+        for statement in tree.body
+    )
+
+
+def export_notebook(input_code: str) -> str:
+    python_exporter = PythonExporter()
+    exported_code, _ = python_exporter.from_file(StringIO(input_code))
+    return exported_code
+
+
+def find_cell_starts(exported_code):
+    return [
+        lineno
+        for lineno, line in enumerate(exported_code.splitlines(), start=1)
+        if CELL_PATTERN.match(line)
+    ]
+
+
+def scan_features(exported_code: str) -> set:
+    names = set()
+    try:
+        for token in tokenize.generate_tokens(StringIO(exported_code).readline):
+            if token.type == tokenize.NAME:
+                names.add(token.string)
+            elif token.type == tokenize.OP and token.string == "{":
+                names.add("{")
+    except (tokenize.TokenError, SyntaxError):
+        # Let the full pipeline handle (and report) unusual code
+        return set(FEATURE_NAMES) | {"imports", "dict_literals", "pass"}
+
+    features = {
+        feature
+        for feature, feature_names in FEATURE_NAMES.items()
+        if names.intersection(feature_names)
+    }
+    if "import" in names:
+        features.add("imports")
+    if "{" in names:
+        features.add("dict_literals")
+    if "pass" in names:
+        features.add("pass")
+    return features
+
+
+def parse_exported(exported_code: str) -> ast.Module:
+    return ast.parse(re.sub(r"[#%].*", "", exported_code), "", "exec")
+
+
+def finish_transform(
+    tree: ast.Module,
+    features: set,
+    runtime_imports: set,
+    interactive_defaults: dict,
+    downsample_plots: bool = False,
+    warm_up: bool = False,
+    native_charts: bool = False,
+    figure_objects: bool = False,
+) -> ast.Module:
+    # Whole-module passes that run after the widget rewrite
+    tree = add_runtime_imports(tree, runtime_imports)
+    if native_charts and "plotting" in features:
+        # Before downsampling, which would hide the plot arguments
+        charts = NativeChartTransformer(downsample_plots)
+        tree = add_runtime_imports(charts.visit(tree), charts.runtime_imports)
+    if downsample_plots and "plotting" in features:
+        downsampler = PlotDownsamplingTransformer()
+        tree = add_runtime_imports(downsampler.visit(tree), downsampler.runtime_imports)
+    if figure_objects and "plotting" in features:
+        # After downsampling, which looks for plt.plot(...) calls
+        figures = FigureObjectTransformer()
+        tree = add_runtime_imports(figures.visit(tree), figures.runtime_imports)
+    if warm_up and interactive_defaults:
+        warmer = WarmUpTransformer(interactive_defaults)
+        tree = add_runtime_imports(warmer.visit(tree), warmer.runtime_imports)
+    return tree
+
+
+def transform(
+    exported_code: str,
+    downsample_plots: bool = False,
+    resize_images: bool = False,
+    features: set = None,
+    workers: int = 1,
+    warm_up: bool = False,
+    native_charts: bool = False,
+    figure_objects: bool = False,
+) -> ast.Module:
+    if features is None:
+        features = scan_features(exported_code)
+    output_ast = parse_exported(exported_code)
+    runtime_imports = set()
+    interactive_defaults = {}
+    if features & set(FEATURE_NAMES):
+        sharded = None
+        if workers > 1:
+            sharded = transform_parallel(output_ast, features, resize_images, workers)
+        if sharded:
+            output_ast, runtime_imports, interactive_defaults = sharded
+        else:
+            transformer = IpywidgetsToStreamlitTransformer(features, resize_images)
+            output_ast = transformer.visit(output_ast)
+            runtime_imports = transformer.runtime_imports
+            interactive_defaults = transformer.interactive_defaults
+    return finish_transform(
+        output_ast,
+        features,
+        runtime_imports,
+        interactive_defaults,
+        downsample_plots=downsample_plots,
+        warm_up=warm_up,
+        native_charts=native_charts,
+        figure_objects=figure_objects,
+    )
+
+
+def split_cells(body, cell_starts):
+    # [(cell number, statements)], statements the transformer created belong to
+    # the cell before them
+    cells = []
+    cell = 0
+    for statement in body:
+        if getattr(statement, "lineno", None):
+            cell = bisect_right(cell_starts, statement.lineno)
+        if not cells or cells[-1][0] != cell:
+            cells.append((cell, []))
+        cells[-1][1].append(statement)
+    return cells
+
+
+def transform_cells(transformer, tree, cell_starts):
+    # Rewrites tree.body one notebook cell at a time and yields (cell number,
+    # statements, printed lines) as each is done. A notebook that needs a
+    # whole-module rewrite (observe() wires handlers into earlier cells) is
+    # transformed first, its printed lines come with the first cell.
+    cells = split_cells(tree.body, cell_starts)
+    starts = []
+    index = 0
+    for _, statements in cells:
+        starts.append(index)
+        index += len(statements)
+    try:
+        facts = transformer.collect_facts(tree, starts)
+    except Exception:
+        # Malformed widget code, let the whole-module pass report it
+        facts = None
+
+    if facts is None:
+        output = StringIO()
+        with contextlib.redirect_stdout(output):
+            tree = transformer.visit(tree)
+        lines = output.getvalue().splitlines()
+        for cell, statements in split_cells(tree.body, cell_starts):
+            yield cell, statements, lines
+            lines = []
+        return
+
+    snapshots, on_click_bindings = facts
+    ends = starts[1:] + [len(tree.body)]
+    new_body = []
+    for (cell, _), start, end, snapshot in zip(cells, starts, ends, snapshots):
+        # A copy of the body, visit_ImportFrom inserts into it
+        module = ast.Module(body=list(tree.body), type_ignores=[])
+        for expr_index, target_index in on_click_bindings:
+            if start <= expr_index < end and not start <= target_index < end:
+                # on_click rewrites the button of another cell, as it would in
+                # another shard, transform_range binds it there
+                module.body[target_index] = copy.copy(module.body[target_index])
+        output = StringIO()
+        with contextlib.redirect_stdout(output):
+            statements = transformer.transform_range(
+                module, start, end, snapshot, on_click_bindings
+            )
+        new_body += statements
+        yield cell, statements, output.getvalue().splitlines()
+    tree.body = new_body
+
+
+def instrument_profiling(tree: ast.Module, exported_code: str) -> ast.Module:
+    profiler = ProfilingTransformer(find_cell_starts(exported_code))
+    return add_runtime_imports(profiler.visit(tree), profiler.runtime_imports)
+
+
+def render(tree: ast.Module, features: set = None) -> str:
+    if features is None or "imports" in features:
+        tree = remove_duplicate_imports(tree)
+    output_code = astor.to_source(tree)
+    # autoflake only drops imports, duplicate dict keys and useless pass
+    if features is not None and not features & {"imports", "dict_literals", "pass"}:
+        return output_code
+    clean_code = remove_unused_imports(output_code)
+    return clean_code
+
+
+def convert_stream(
+    input_code: str,
+    downsample_plots: bool = False,
+    profile: bool = False,
+    resize_images: bool = False,
+    workers: int = 1,
+    warm_up: bool = False,
+    native_charts: bool = False,
+    figure_objects: bool = False,
+):
+    # Yields a CellResult per code cell as soon as its widgets are rewritten,
+    # then a Conversion with the finished app. Cell code is shown before the
+    # whole-module passes (downsampling, warm-up, profiling, import cleanup).
+    started = time.perf_counter()
+    first_output_seconds = None
+    diagnostics = []
+    exported_code = export_notebook(input_code)
+    features = scan_features(exported_code)
+    cell_starts = find_cell_starts(exported_code)
+    tree = parse_exported(exported_code)
+    runtime_imports = set()
+    interactive_defaults = {}
+
+    if not features & set(FEATURE_NAMES):
+        cells = [(cell, body, []) for cell, body in split_cells(tree.body, cell_starts)]
+    else:
+        sharded = None
+        if workers > 1:
+            output = StringIO()
+            with contextlib.redirect_stdout(output):
+                sharded = transform_parallel(tree, features, resize_images, workers)
+        if sharded:
+            tree, runtime_imports, interactive_defaults = sharded
+            # All cells are done at once, printed lines come with the first
+            lines = output.getvalue().splitlines()
+            cells = []
+            for cell, body in split_cells(tree.body, cell_starts):
+                cells.append((cell, body, lines))
+                lines = []
+        else:
+            transformer = IpywidgetsToStreamlitTransformer(features, resize_images)
+            runtime_imports = transformer.runtime_imports
+            interactive_defaults = transformer.interactive_defaults
+            cells = transform_cells(transformer, tree, cell_starts)
+
+    for cell, statements, lines in cells:
+        diagnostics += lines
+        code = astor.to_source(ast.Module(body=statements, type_ignores=[]))
+        if first_output_seconds is None:
+            first_output_seconds = time.perf_counter() - started
+        yield CellResult(cell=cell, code=code, diagnostics=lines)
+
+    tree = finish_transform(
+        tree,
+        features,
+        runtime_imports,
+        interactive_defaults,
+        downsample_plots=downsample_plots,
+        warm_up=warm_up,
+        native_charts=native_charts,
+        figure_objects=figure_objects,
+    )
+    if profile:
+        tree = instrument_profiling(tree, exported_code)
+    code = render(tree, features)
+    seconds = time.perf_counter() - started
+    yield Conversion(
+        code=code,
+        diagnostics=diagnostics,
+        first_output_seconds=seconds
+        if first_output_seconds is None
+        else first_output_seconds,
+        seconds=seconds,
+    )
+
+
+def convert(
+    input_code: str,
+    downsample_plots: bool = False,
+    profile: bool = False,
+    resize_images: bool = False,
+    workers: int = 1,
+    warm_up: bool = False,
+    native_charts: bool = False,
+    figure_objects: bool = False,
+) -> str:
+    for result in convert_stream(
+        input_code,
+        downsample_plots=downsample_plots,
+        profile=profile,
+        resize_images=resize_images,
+        workers=workers,
+        warm_up=warm_up,
+        native_charts=native_charts,
+        figure_objects=figure_objects,
+    ):
+        if isinstance(result, CellResult):
+            for line in result.diagnostics:
+                print(line)
+    return result.code
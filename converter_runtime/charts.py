@@ -0,0 +1,159 @@
+import altair as alt
+import matplotlib
+import matplotlib.colors as mcolors
+import numpy as np
+import pandas as pd
+import streamlit as st
+from matplotlib.figure import Figure
+
+from converter_runtime.downsampling import MAX_POINTS, downsample
+
+MARKS = {"plot": "line", "scatter": "circle", "bar": "bar"}
+# plt.scatter's default marker area, in square points
+SCATTER_SIZE = 36
+
+
+def _column(values):
+    # (array, Vega-Lite type) of a 1-D series, None for anything else
+    values = np.asarray(values)
+    if values.ndim != 1:
+        return None
+    kind = values.dtype.kind
+    if kind in "biuf":
+        return values, "quantitative"
+    if kind == "M":
+        return values, "temporal"
+    if kind == "U" or kind == "O" and all(isinstance(v, str) for v in values):
+        return values, "nominal"
+    return None
+
+
+def _layer_data(kind, args, downsample_plots):
+    # (x, y, x type) of one plot call, None when it has to stay a figure
+    if len(args) == 1:
+        y = args[0]
+        # plt.plot(series) draws against the index, plt.plot(list) against 0..n-1
+        x = y.index if isinstance(y, pd.Series) else np.arange(np.size(y))
+        args = (x, y)
+    x, y = _column(args[0]), _column(args[1])
+    if x is None or y is None or y[1] != "quantitative" or len(x[0]) != len(y[0]):
+        return None
+    (x, x_type), (y, _) = x, y
+    if len(y) > MAX_POINTS:
+        # The browser would get every point, rasterising is cheaper then
+        if not downsample_plots or kind == "bar" or x_type == "nominal":
+            return None
+        x, y = downsample(x, y)
+    if kind == "bar" and x_type == "quantitative":
+        # Bars sit side by side like matplotlib's, not on a continuous axis
+        x_type = "ordinal"
+    return x, y, x_type
+
+
+def _colors(layers):
+    # Explicit colors as given, the others from matplotlib's color cycle
+    cycle = matplotlib.rcParams["axes.prop_cycle"].by_key().get("color", ["C0"])
+    colors = []
+    index = 0
+    for _, _, kwargs in layers:
+        if "color" in kwargs:
+            colors.append(mcolors.to_hex(kwargs["color"]))
+        else:
+            colors.append(mcolors.to_hex(cycle[index % len(cycle)]))
+            index += 1
+    return colors
+
+
+def _figure(layers, title, xlabel, ylabel, legend, figsize):
+    # The figure the notebook drew, for data a chart cannot show as is. Not a
+    # pyplot figure, sessions on other threads could draw on that.
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    for kind, args, kwargs in layers:
+        getattr(ax, kind)(*args, **kwargs)
+    if title is not None:
+        ax.set_title(title)
+    if xlabel is not None:
+        ax.set_xlabel(xlabel)
+    if ylabel is not None:
+        ax.set_ylabel(ylabel)
+    if legend:
+        ax.legend()
+    st.pyplot(fig)
+
+
+def native_chart(
+    layers,
+    title=None,
+    xlabel=None,
+    ylabel=None,
+    legend=False,
+    figsize=None,
+    downsample_plots=False,
+):
+    # layers are the figure's plot calls as (method, args, kwargs)
+    data = [_layer_data(kind, args, downsample_plots) for kind, args, _ in layers]
+    try:
+        colors = _colors(layers)
+    except ValueError:
+        colors = None
+    if (
+        colors is None
+        or any(layer is None for layer in data)
+        or len({x_type for *_, x_type in data}) > 1
+    ):
+        _figure(layers, title, xlabel, ylabel, legend, figsize)
+        return
+
+    names = []
+    labelled = []
+    for index, (_, _, kwargs) in enumerate(layers):
+        name = str(kwargs.get("label", f"series {index + 1}"))
+        if name in names:
+            name = f"{name} ({index + 1})"
+        names.append(name)
+        if "label" in kwargs:
+            labelled.append(name)
+
+    x_type = data[0][2]
+    # Categories keep the order they were drawn in, as in matplotlib
+    x_options = {"sort": None} if x_type == "nominal" else {}
+    scale = alt.Scale(domain=names, range=colors)
+    chart_legend = alt.Legend(title=None, values=labelled) if legend else None
+    charts = []
+    for (kind, _, _), (x, y, _), name in zip(layers, data, names):
+        # Lines join the points in the order they were drawn, not sorted by x
+        frame = pd.DataFrame(
+            {"x": x, "y": y, "series": name, "order": np.arange(len(x))}
+        )
+        chart = alt.Chart(frame)
+        encoding = {}
+        if kind == "scatter":
+            chart = chart.mark_circle(size=SCATTER_SIZE, opacity=1)
+        else:
+            chart = getattr(chart, f"mark_{MARKS[kind]}")()
+        if kind == "plot":
+            encoding["order"] = alt.Order("order", type="quantitative")
+        charts.append(
+            chart.encode(
+                x=alt.X(
+                    "x",
+                    type=x_type,
+                    title=None if xlabel is None else str(xlabel),
+                    **x_options,
+                ),
+                y=alt.Y(
+                    "y",
+                    type="quantitative",
+                    title=None if ylabel is None else str(ylabel),
+                ),
+                color=alt.Color(
+                    "series", type="nominal", scale=scale, legend=chart_legend
+                ),
+                **encoding,
+            )
+        )
+    chart = alt.layer(*charts) if len(charts) > 1 else charts[0]
+    if title is not None:
+        chart = chart.properties(title=str(title))
+    st.altair_chart(chart, use_container_width=True)
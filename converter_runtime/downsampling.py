@@ -0,0 +1,41 @@
+import numpy as np
+
+MAX_POINTS = 4000
+
+
+def downsample(*arrays, max_points=MAX_POINTS):
+    # Min/max-per-bucket decimation of aligned plot series. Buckets are picked
+    # on the last array (the one drawn on the value axis), so spikes survive.
+    values = np.asarray(arrays[-1])
+    # plt.plot(0.5, 0.5, "ro") draws a single point
+    if values.ndim != 1:
+        return arrays
+    n = len(values)
+    if (
+        n <= max_points
+        or values.dtype.kind not in "biuf"
+        or any(np.ndim(a) != 1 or len(a) != n for a in arrays)
+    ):
+        return arrays
+
+    n_buckets = max(max_points // 2, 1)
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+
+    # Pad the last bucket by repeating the final point
+    index = np.minimum(np.arange(n_buckets * size), n - 1)
+    buckets = values[index].reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    lows = np.minimum(offsets + buckets.argmin(axis=1), n - 1)
+    highs = np.minimum(offsets + buckets.argmax(axis=1), n - 1)
+    keep = np.unique(np.concatenate([[0, n - 1], lows, highs]))
+
+    if len(arrays) == 1:
+        # plt.plot(y) draws against the index, a Series' own one or positions,
+        # the way matplotlib.cbook.index_of picks it
+        try:
+            x = arrays[0].index.to_numpy()
+        except AttributeError:
+            x = np.arange(n)
+        return x[keep], values[keep]
+    return tuple(np.asarray(a)[keep] for a in arrays)
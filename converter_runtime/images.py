@@ -0,0 +1,81 @@
+import hashlib
+import io
+import re
+
+import streamlit as st
+from PIL import Image
+
+CACHE_ENTRIES = 64
+JPEG_QUALITY = 90
+
+
+def _pixels(size):
+    if isinstance(size, (int, float)):
+        pixels = int(size)
+    else:
+        match = re.fullmatch(r"\s*(\d+)\s*(px)?\s*", str(size))
+        pixels = int(match.group(1)) if match else 0
+    return pixels if pixels > 0 else None
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+def _encode(image, format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def _resized(digest, width, height, _data):
+    # Keyed by content hash and target size, the bytes themselves are not hashed
+    image = Image.open(io.BytesIO(_data))
+    if getattr(image, "is_animated", False):
+        return _data, None, width or image.width
+    original_width, original_height = image.size
+    if width is None:
+        width = max(round(original_width * height / original_height), 1)
+    elif height is None:
+        height = max(round(original_height * width / original_width), 1)
+    if width >= original_width and height >= original_height:
+        # Never upscale, the browser stretches the original just as well
+        return _data, None, width
+
+    alpha = _has_alpha(image)
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA" if alpha else "RGB")
+    image = image.resize((width, height), resample=Image.LANCZOS)
+    candidates = {"PNG": _encode(image, "PNG", optimize=True)}
+    if not alpha:
+        candidates["JPEG"] = _encode(
+            image.convert("RGB") if image.mode != "L" else image,
+            "JPEG",
+            quality=JPEG_QUALITY,
+            optimize=True,
+        )
+    format = min(candidates, key=lambda name: len(candidates[name]))
+    return candidates[format], format, width
+
+
+def fit_image(image, width=None, height=None):
+    # Keyword arguments for st.image showing the image at the requested size
+    target_width = _pixels(width) if width is not None else None
+    target_height = _pixels(height) if height is not None else None
+    if (
+        not isinstance(image, (bytes, bytearray, memoryview))
+        or (width is not None and target_width is None)
+        or (height is not None and target_height is None)
+        or (target_width is None and target_height is None)
+    ):
+        # Relative sizes like "50%" are left to the column width
+        return {"image": image, "use_column_width": True}
+
+    data = bytes(image)
+    digest = hashlib.sha256(data).hexdigest()
+    data, format, display_width = _resized(digest, target_width, target_height, data)
+    # A matching output_format keeps Streamlit from encoding the bytes again
+    return {"image": data, "width": display_width, "output_format": format or "auto"}
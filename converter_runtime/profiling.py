@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+import streamlit as st
+
+# Set to a file path to append one JSON line per rerun
+LOG_PATH_VARIABLE = "CONVERTER_PROFILE_LOG"
+MAX_RERUNS = 1000
+
+_lock = threading.Lock()
+_calls = defaultdict(int)
+_totals = defaultdict(float)
+_cache_misses = defaultdict(int)
+_reruns = []
+# Streamlit runs every session's script on its own thread
+_current = threading.local()
+
+
+def _record(label, seconds):
+    with _lock:
+        _calls[label] += 1
+        _totals[label] += seconds
+    timings = getattr(_current, "timings", None)
+    if timings is not None:
+        timings[label] = timings.get(label, 0.0) + seconds
+
+
+@contextmanager
+def cell(number):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(f"cell {number}", time.perf_counter() - start)
+
+
+def function(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def cache_miss(name):
+    # Sits inside the cache decorator, so it only runs when the cache misses
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _lock:
+                _cache_misses[name] += 1
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def start_rerun():
+    _current.start = time.perf_counter()
+    _current.timings = {}
+
+
+def finish_rerun():
+    record = {
+        "time": time.time(),
+        "duration": time.perf_counter() - _current.start,
+        "timings": _current.timings,
+    }
+    _current.timings = None
+    with _lock:
+        _reruns.append(record)
+        del _reruns[:-MAX_RERUNS]
+
+    log_path = os.environ.get(LOG_PATH_VARIABLE)
+    if log_path:
+        with _lock, open(log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    render_sidebar(record)
+
+
+def summary():
+    with _lock:
+        rows = []
+        for label in sorted(_calls, key=_totals.get, reverse=True):
+            row = {
+                "name": label,
+                "calls": _calls[label],
+                "total ms": round(_totals[label] * 1000, 2),
+                "mean ms": round(_totals[label] * 1000 / _calls[label], 2),
+            }
+            if label in _cache_misses:
+                hits = max(_calls[label] - _cache_misses[label], 0)
+                row["cache hit rate"] = round(hits / _calls[label], 3)
+            rows.append(row)
+        return rows
+
+
+def to_json_lines():
+    with _lock:
+        return "".join(json.dumps(record) + "\n" for record in _reruns)
+
+
+def render_sidebar(record):
+    with st.sidebar.expander("Profiling"):
+        st.metric("Last rerun", f"{record['duration'] * 1000:.1f} ms")
+        with _lock:
+            durations = [rerun["duration"] for rerun in _reruns]
+        st.caption(
+            f"{len(durations)} reruns, "
+            f"mean {sum(durations) * 1000 / len(durations):.1f} ms"
+        )
+        st.dataframe(summary())
+        st.download_button(
+            "Export JSON lines",
+            data=to_json_lines(),
+            file_name="profile.jsonl",
+            mime="application/jsonl",
+        )
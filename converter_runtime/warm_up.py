@@ -0,0 +1,71 @@
+import hmac
+import itertools
+import json
+import os
+
+import streamlit as st
+
+# ?warm_up={"f": {"n": [10, 20]}}&warm_up_secret=... marks a session opened
+# by warm_up.py. Without WARM_UP_SECRET set on the app nobody can warm it up.
+QUERY_PARAMETER = "warm_up"
+SECRET_PARAMETER = "warm_up_secret"
+SECRET_VARIABLE = "WARM_UP_SECRET"
+MAX_CALLS = 256
+
+
+def _requested_grid():
+    # None for regular visitors, the per-function grid in a warm-up session
+    secret = os.environ.get(SECRET_VARIABLE)
+    if not secret:
+        return None
+    params = st.experimental_get_query_params()
+    values = params.get(QUERY_PARAMETER)
+    given = params.get(SECRET_PARAMETER)
+    if not values or not given:
+        return None
+    if not hmac.compare_digest(given[0].encode("utf-8"), secret.encode("utf-8")):
+        return None
+    try:
+        grid = json.loads(values[0])
+    except ValueError:
+        grid = {}
+    return grid if isinstance(grid, dict) else {}
+
+
+def _coerce(value, default):
+    # JSON has no tuples, and 10 and 10.0 are different cache keys
+    if isinstance(default, tuple) and isinstance(value, list):
+        return tuple(_coerce(v, d) for v, d in zip(value, default))
+    if isinstance(default, float) and type(value) is int:
+        return float(value)
+    return value
+
+
+def combinations(defaults, grid):
+    # The defaults first, then every grid combination with the rest at defaults
+    names = [name for name in grid if name in defaults]
+    choices = [
+        grid[name] if isinstance(grid[name], list) else [grid[name]] for name in names
+    ]
+    combos = [dict(defaults)]
+    for values in itertools.product(*choices):
+        if len(combos) >= MAX_CALLS:
+            break
+        combo = dict(defaults)
+        combo.update(
+            {name: _coerce(value, defaults[name]) for name, value in zip(names, values)}
+        )
+        if combo not in combos:
+            combos.append(combo)
+    return combos
+
+
+def warm_up(function, name, defaults):
+    grid = _requested_grid()
+    if grid is None:
+        return
+    for values in combinations(defaults, grid.get(name, {})):
+        try:
+            function(**values)
+        except Exception as error:
+            print(f"Warning: warming up {name}({values}) failed: {error}")
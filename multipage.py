@@ -0,0 +1,331 @@
+import ast
+import re
+from bisect import bisect_right
+from collections import namedtuple
+
+from converter import (
+    export_notebook,
+    find_cell_starts,
+    instrument_profiling,
+    render,
+    scan_features,
+    transform,
+)
+
+Page = namedtuple("Page", ["title", "code", "statement_count", "rerun_cost"])
+
+HEADING_PATTERN = re.compile(r"^# (#{1,6}) +(.+)$")
+LOOP_WEIGHT = 10
+
+
+def find_sections(exported_code, heading_level=2, cells_per_page=10):
+    lines = exported_code.splitlines()
+    sections = []
+    for lineno, line in enumerate(lines, start=1):
+        match = HEADING_PATTERN.match(line)
+        if match and len(match.group(1)) <= heading_level:
+            sections.append((lineno, match.group(2).strip()))
+
+    if not sections:
+        # No headings to follow, fall back to fixed-size groups of cells
+        cells = find_cell_starts(exported_code)
+        for number, start in enumerate(cells[::cells_per_page], start=1):
+            sections.append((start, f"Part {number}"))
+
+    if not sections:
+        return [(1, "Notebook")]
+
+    # Code above the first heading belongs to the first page
+    sections[0] = (1, sections[0][1])
+    return sections
+
+
+def bound_names(statement):
+    if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return {statement.name}
+    if isinstance(statement, (ast.Import, ast.ImportFrom)):
+        return {
+            alias.asname or alias.name.split(".")[0] for alias in statement.names
+        }
+
+    names = set()
+    nodes = [statement]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+            continue
+        if isinstance(node, ast.Lambda):
+            continue
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        # df["x"] = ... and df.append(...) change df in place
+        if isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(
+            node.ctx, ast.Store
+        ):
+            names.update(_base_names(node))
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+            if isinstance(node.value.func, ast.Attribute):
+                names.update(_base_names(node.value.func))
+        nodes.extend(ast.iter_child_nodes(node))
+    return names
+
+
+def _base_names(node):
+    while isinstance(node, (ast.Subscript, ast.Attribute)):
+        node = node.value
+    return {node.id} if isinstance(node, ast.Name) else set()
+
+
+def used_names(statement):
+    return {
+        node.id
+        for node in ast.walk(statement)
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+    }
+
+
+def estimate_cost(statements, functions=None, loop_weight=LOOP_WEIGHT):
+    # Static estimate in AST nodes evaluated, loop bodies weigh loop_weight times
+    functions = functions or {}
+
+    def cost(node, seen):
+        if isinstance(
+            node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+        ):
+            return 1
+        total = 1
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in functions
+            and node.func.id not in seen
+        ):
+            function = functions[node.func.id]
+            total += sum(cost(n, seen | {function.name}) for n in function.body)
+        if isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+            header = node.test if isinstance(node, ast.While) else node.iter
+            body = sum(cost(n, seen) for n in node.body)
+            orelse = sum(cost(n, seen) for n in node.orelse)
+            return total + cost(header, seen) + loop_weight * body + orelse
+        if isinstance(
+            node, (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)
+        ):
+            elements = (
+                [node.key, node.value] if isinstance(node, ast.DictComp) else [node.elt]
+            )
+            body = sum(cost(n, seen) for n in elements)
+            for generator in node.generators:
+                total += cost(generator.iter, seen)
+                body += sum(cost(n, seen) for n in generator.ifs)
+            return total + loop_weight ** len(node.generators) * body
+        return total + sum(cost(n, seen) for n in ast.iter_child_nodes(node))
+
+    return sum(cost(statement, frozenset()) for statement in statements)
+
+
+def _references_streamlit(statement, st_functions):
+    names = used_names(statement)
+    return "st" in names or bool(names & st_functions)
+
+
+def _shared_setup(statements, returned_names):
+    returned = [ast.Name(id=name, ctx=ast.Load()) for name in returned_names]
+    targets = [ast.Name(id=name, ctx=ast.Store()) for name in returned_names]
+    setup = ast.FunctionDef(
+        name="_shared_setup",
+        args=ast.arguments(
+            posonlyargs=[],
+            args=[],
+            vararg=None,
+            kwonlyargs=[],
+            kw_defaults=[],
+            kwarg=None,
+            defaults=[],
+        ),
+        body=statements
+        + [
+            ast.Return(
+                value=returned[0]
+                if len(returned) == 1
+                else ast.Tuple(elts=returned, ctx=ast.Load())
+            )
+        ],
+        decorator_list=[
+            ast.Attribute(
+                value=ast.Name(id="st", ctx=ast.Load()),
+                attr="cache_resource",
+                ctx=ast.Load(),
+            )
+        ],
+        returns=None,
+    )
+    target = (
+        targets[0] if len(targets) == 1 else ast.Tuple(elts=targets, ctx=ast.Store())
+    )
+    call = ast.Assign(
+        targets=[target],
+        value=ast.Call(
+            func=ast.Name(id="_shared_setup", ctx=ast.Load()), args=[], keywords=[]
+        ),
+    )
+    return [setup, call]
+
+
+def _changed_names(statements, functions):
+    # Names whose objects the statements change in place, also through the
+    # module functions they call. Binding a name again leaves the old object be.
+    names = set()
+    called = set()
+    for node in ast.walk(ast.Module(body=list(statements), type_ignores=[])):
+        if isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(
+            node.ctx, (ast.Store, ast.Del)
+        ):
+            names |= _base_names(node)
+        elif isinstance(node, ast.AugAssign):
+            names |= _base_names(node.target)
+        elif isinstance(node, ast.Call):
+            # Any method call may change its object, rng.random(3) moves the
+            # generator on wherever it is called
+            if isinstance(node.func, ast.Attribute):
+                names |= _base_names(node.func.value)
+            elif isinstance(node.func, ast.Name):
+                called.add(node.func.id)
+    for name in called & set(functions):
+        names |= _changed_names(functions[name].body, {})
+    return names
+
+
+def build_page(imports, earlier, section, functions):
+    # Walk back from the section to the earlier statements it depends on,
+    # np.random.seed(...) and the like do not redefine the module
+    module_names = set().union(*(bound_names(statement) for statement in imports))
+    needed = set().union(*(used_names(statement) for statement in section))
+    selected = []
+    for statement in reversed(earlier):
+        changes = bound_names(statement)
+        if isinstance(statement, (ast.Assign, ast.AugAssign, ast.AnnAssign)):
+            # sample = rng.random(3) leaves rng where the page expects it
+            changes |= _changed_names([statement], {})
+        if (changes - module_names) & needed:
+            selected.insert(0, statement)
+            needed |= used_names(statement)
+
+    st_functions = {
+        name
+        for name, function in functions.items()
+        if _references_streamlit(function, set())
+    }
+    # The cached setup hands every rerun and session the same objects, so one
+    # the page changes in place (data.append(...) or rng.random(), also in a
+    # function it calls) has to be built again on every rerun
+    changed = _changed_names(section, functions)
+    while True:
+        definitions, direct, cached = [], [], []
+        direct_names = set()
+        for statement in selected:
+            if isinstance(
+                statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            ):
+                definitions.append(statement)
+            elif _references_streamlit(
+                statement, st_functions | direct_names
+            ) or bound_names(statement) & (changed | direct_names):
+                # Widgets, output and changed objects run on every rerun
+                direct.append(statement)
+                direct_names |= bound_names(statement)
+            else:
+                cached.append(statement)
+        direct_changed = _changed_names(direct, functions)
+        if direct_changed <= changed:
+            break
+        changed |= direct_changed
+
+    body = list(imports) + definitions
+    rerun_statements = definitions + direct + section
+    if cached:
+        later_names = set().union(
+            *(used_names(statement) for statement in rerun_statements)
+        )
+        returned_names = []
+        for statement in cached:
+            for name in sorted(bound_names(statement)):
+                if name in later_names and name not in returned_names:
+                    returned_names.append(name)
+        if returned_names:
+            setup, call = _shared_setup(cached, returned_names)
+            body += [setup, call]
+            rerun_statements = definitions + [call] + direct + section
+    body += direct + section
+
+    return ast.Module(body=body, type_ignores=[]), rerun_statements
+
+
+def convert_to_pages(
+    input_code,
+    downsample_plots=False,
+    profile=False,
+    resize_images=False,
+    warm_up=False,
+    native_charts=False,
+    figure_objects=False,
+    heading_level=2,
+    cells_per_page=10,
+):
+    exported_code = export_notebook(input_code)
+    sections = find_sections(exported_code, heading_level, cells_per_page)
+    features = scan_features(exported_code)
+    tree = transform(
+        exported_code,
+        downsample_plots=downsample_plots,
+        resize_images=resize_images,
+        features=features,
+        warm_up=warm_up,
+        native_charts=native_charts,
+        figure_objects=figure_objects,
+    )
+
+    # Statements created by the transformer inherit the section before them
+    starts = [start for start, _ in sections]
+    imports = []
+    warm_up_defaults = []
+    section_bodies = [[] for _ in sections]
+    current = 0
+    for statement in tree.body:
+        if getattr(statement, "lineno", None):
+            current = bisect_right(starts, statement.lineno) - 1
+        if isinstance(statement, (ast.Import, ast.ImportFrom)):
+            imports.append(statement)
+        elif bound_names(statement) == {"WARM_UP_DEFAULTS"}:
+            # A literal, copied to the pages that warm up like an import
+            warm_up_defaults.append(statement)
+        else:
+            section_bodies[current].append(statement)
+
+    functions = {
+        statement.name: statement
+        for statement in tree.body
+        if isinstance(statement, ast.FunctionDef)
+    }
+    pages = []
+    earlier = []
+    for (_, title), section in zip(sections, section_bodies):
+        if section:
+            page_imports = imports
+            if "WARM_UP_DEFAULTS" in set().union(*map(used_names, section)):
+                page_imports = imports + warm_up_defaults
+            module, rerun_statements = build_page(
+                page_imports, earlier, section, functions
+            )
+            if profile:
+                module = instrument_profiling(module, exported_code)
+            pages.append(
+                Page(
+                    title=title,
+                    code=render(module, features),
+                    statement_count=len(rerun_statements),
+                    rerun_cost=estimate_cost(rerun_statements, functions),
+                )
+            )
+        earlier += section
+    return pages
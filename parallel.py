@@ -0,0 +1,104 @@
+import ast
+import contextlib
+import io
+import multiprocessing
+import sys
+
+from tree_transformers import IpywidgetsToStreamlitTransformer
+
+MIN_SHARD_STATEMENTS = 100
+
+# Inherited by the forked workers, the parent never modifies it
+_shared_module = None
+
+
+def shard_starts(body, shards):
+    # Contiguous shards with about the same number of source lines
+    weights = [statement.end_lineno - statement.lineno + 1 for statement in body]
+    total = sum(weights)
+    starts = [0]
+    seen = 0
+    for index, weight in enumerate(weights):
+        if seen >= total * len(starts) / shards and len(starts) < shards:
+            starts.append(index)
+        seen += weight
+    return starts
+
+
+def _transform_shard(features, resize_images, start, end, facts, on_click_bindings):
+    body = _shared_module.body
+    original = {
+        id(statement): (index, ast.dump(statement))
+        for index, statement in enumerate(body[start:end], start=start)
+    }
+    transformer = IpywidgetsToStreamlitTransformer(features, resize_images)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        new_body = transformer.transform_range(
+            _shared_module, start, end, facts, on_click_bindings
+        )
+
+    # Untouched statements are not sent back, the parent has its own copy
+    items = []
+    for statement in new_body:
+        index, dump = original.get(id(statement), (None, None))
+        if dump is not None and ast.dump(statement) == dump:
+            items.append(index)
+        else:
+            items.append(statement)
+    return (
+        items,
+        output.getvalue(),
+        transformer.runtime_imports,
+        transformer.interactive_defaults,
+    )
+
+
+def transform_parallel(module, features, resize_images=False, workers=2):
+    # Returns (module, runtime_imports, interactive_defaults), or None when the
+    # notebook is too small or needs a whole-module rewrite and has to go
+    # through the serial pass
+    global _shared_module
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    shards = min(workers, len(module.body) // MIN_SHARD_STATEMENTS)
+    if shards < 2:
+        return None
+
+    starts = shard_starts(module.body, shards)
+    transformer = IpywidgetsToStreamlitTransformer(features, resize_images)
+    try:
+        facts = transformer.collect_facts(module, starts)
+    except Exception:
+        # Malformed widget code, let the serial pass report it
+        return None
+    if facts is None:
+        return None
+    snapshots, on_click_bindings = facts
+
+    ends = starts[1:] + [len(module.body)]
+    tasks = [
+        (features, resize_images, start, end, snapshot, on_click_bindings)
+        for start, end, snapshot in zip(starts, ends, snapshots)
+    ]
+    _shared_module = module
+    try:
+        # One fresh fork per shard, so each starts from the unmodified tree
+        context = multiprocessing.get_context("fork")
+        with context.Pool(len(tasks), maxtasksperchild=1) as pool:
+            results = pool.starmap(_transform_shard, tasks, chunksize=1)
+    finally:
+        _shared_module = None
+
+    new_body = []
+    runtime_imports = set()
+    interactive_defaults = {}
+    for items, output, shard_imports, shard_defaults in results:
+        sys.stdout.write(output)
+        runtime_imports |= shard_imports
+        for name, values in shard_defaults.items():
+            interactive_defaults.setdefault(name, values)
+        for item in items:
+            new_body.append(module.body[item] if isinstance(item, int) else item)
+    module.body = new_body
+    return module, runtime_imports, interactive_defaults
@@ -0,0 +1,217 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import nbformat
+
+CONVERT_OPTIONS = [
+    "downsample_plots",
+    "profile",
+    "resize_images",
+    "warm_up",
+    "native_charts",
+    "figure_objects",
+]
+LATENCY_WINDOW = 1000
+
+
+def _warm_worker():
+    # Pay for the nbconvert and transformer imports before the first request
+    import converter  # noqa: F401
+
+
+def _convert(input_code, options):
+    from converter import convert
+
+    return convert(input_code, **options)
+
+
+class ConversionService:
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = self._start_pool()
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.restarts = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def _start_pool(self):
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+        # Workers start on demand, start them all now
+        for _ in range(self.workers):
+            pool.submit(_warm_worker)
+        return pool
+
+    def _restart_pool(self, broken):
+        # A worker that died (out of memory on a huge notebook, say) breaks the
+        # whole pool, later requests get a new one. Called with the lock held.
+        if self.pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.pool = self._start_pool()
+            self.restarts += 1
+
+    def convert(self, input_code, options):
+        key = hashlib.sha256(
+            json.dumps([input_code, options], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        started = time.perf_counter()
+        with self.lock:
+            self.requests += 1
+            coalesced = key in self.in_flight
+            if coalesced:
+                # The same notebook is already converting, share its result
+                self.coalesced += 1
+                future, pool = self.in_flight[key]
+            else:
+                pool = self.pool
+                try:
+                    future = pool.submit(_convert, input_code, options)
+                except BrokenProcessPool:
+                    self._restart_pool(pool)
+                    pool = self.pool
+                    future = pool.submit(_convert, input_code, options)
+                self.in_flight[key] = future, pool
+        if not coalesced:
+            # Outside the lock, a finished future runs the callback right away
+            future.add_done_callback(lambda _: self._finished(key, future))
+        try:
+            return future.result(), key, coalesced
+        except Exception as e:
+            with self.lock:
+                self.failures += 1
+                if isinstance(e, BrokenProcessPool):
+                    self._restart_pool(pool)
+            raise
+        finally:
+            with self.lock:
+                self.latencies.append(time.perf_counter() - started)
+
+    def _finished(self, key, future):
+        with self.lock:
+            if self.in_flight.get(key, (None,))[0] is future:
+                del self.in_flight[key]
+
+    def metrics(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            in_flight = len(self.in_flight)
+            metrics = {
+                "workers": self.workers,
+                "in_flight": in_flight,
+                "queue_depth": max(in_flight - self.workers, 0),
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+                "restarts": self.restarts,
+            }
+        if latencies:
+            metrics["latency_ms"] = {
+                "count": len(latencies),
+                "mean": round(sum(latencies) * 1000 / len(latencies), 2),
+                "p50": round(latencies[len(latencies) // 2] * 1000, 2),
+                "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+                "max": round(latencies[-1] * 1000, 2),
+            }
+        return metrics
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.service.metrics())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/convert":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            notebook = request["notebook"]
+            if not isinstance(notebook, str):
+                notebook = json.dumps(notebook)
+            options = request.get("options", {})
+            unknown = set(options) - set(CONVERT_OPTIONS)
+            if unknown:
+                raise ValueError(f"Unknown options: {', '.join(sorted(unknown))}")
+            # A notebook nbconvert would reject is the client's error, not a
+            # failed conversion
+            nbformat.validate(
+                nbformat.reads(notebook, as_version=4), relax_add_props=True
+            )
+        except (ValueError, KeyError, TypeError, nbformat.ValidationError) as e:
+            # Validation errors go on to dump the whole schema, keep the summary
+            message = str(e).splitlines()[0] if str(e) else repr(e)
+            self._send_json(400, {"error": f"Invalid request: {message}"})
+            return
+
+        try:
+            code, key, coalesced = self.service.convert(notebook, options)
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {"code": code, "hash": key, "coalesced": coalesced})
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def convert_remote(url, notebook, **options):
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/convert",
+        data=json.dumps({"notebook": notebook, "options": options}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())["code"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local notebook conversion service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    service = ConversionService(args.workers)
+    ConversionHandler.service = service
+    server = ThreadingHTTPServer((args.host, args.port), ConversionHandler)
+    print(f"Serving conversions on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+import types
+from collections import defaultdict, namedtuple
+from functools import partialmethod, wraps
+from pathlib import Path
+
+Widget = namedtuple("Widget", ["kind", "params", "default"])
+RerunResult = namedtuple(
+    "RerunResult", ["step", "seconds", "peak_bytes", "figures", "open_figures", "error"]
+)
+
+# Positional parameters of the Streamlit widgets the converter emits
+WIDGET_PARAMS = {
+    "slider": ["label", "min_value", "max_value", "value", "step"],
+    "select_slider": ["label", "options", "value"],
+    "number_input": ["label", "min_value", "max_value", "value", "step"],
+    "text_input": ["label", "value"],
+    "text_area": ["label", "value"],
+    "checkbox": ["label", "value"],
+    "selectbox": ["label", "options", "index"],
+    "radio": ["label", "options", "index"],
+    "multiselect": ["label", "options", "default"],
+    "date_input": ["label", "value"],
+    "time_input": ["label", "value"],
+    "color_picker": ["label", "value"],
+    "file_uploader": ["label", "type", "accept_multiple_files"],
+    "button": ["label"],
+    "download_button": ["label", "data"],
+    "form_submit_button": ["label"],
+}
+BUTTON_KINDS = ["button", "download_button", "form_submit_button"]
+
+
+class StopRun(Exception):
+    pass
+
+
+class SessionState(dict):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        del self[name]
+
+
+class UploadedFile(io.BytesIO):
+    def __init__(self, path):
+        super().__init__(Path(path).read_bytes())
+        self.name = Path(path).name
+        self.size = len(self.getvalue())
+
+
+class Container:
+    # Returned by layout calls, st.expander(...) etc. forward to the stand-in
+    def __init__(self, st):
+        self._st = st
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._st, name)
+
+
+class SimulatedStreamlit(types.ModuleType):
+    def __init__(self):
+        super().__init__("streamlit")
+        self.session_state = SessionState()
+        self.sidebar = Container(self)
+        self.overrides = {}
+        self.widgets = {}
+        self.cached = {}
+        self.start_run()
+
+    def start_run(self):
+        self.figures = 0
+        self.elements = 0
+        self.seen_widgets = defaultdict(int)
+
+    def __getattr__(self, name):
+        # Text, charts and other output elements do not affect the rerun
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self._element
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def _element(self, *args, **kwargs):
+        self.elements += 1
+        return Container(self)
+
+    def columns(self, spec, **kwargs):
+        count = spec if isinstance(spec, int) else len(spec)
+        return [Container(self) for _ in range(count)]
+
+    def tabs(self, labels):
+        return [Container(self) for _ in labels]
+
+    def stop(self):
+        raise StopRun()
+
+    def experimental_get_query_params(self):
+        # The simulated session is opened without a query string
+        return {}
+
+    def pyplot(self, fig=None, clear_figure=None, **kwargs):
+        import matplotlib.pyplot as plt
+
+        # Rasterise like Streamlit does, this is usually the costly part
+        self.figures += 1
+        if clear_figure is None:
+            clear_figure = fig is None
+        if fig is None:
+            fig = plt.gcf()
+        kwargs.pop("use_container_width", None)
+        fig.savefig(io.BytesIO(), **{"format": "png", **kwargs})
+        if clear_figure:
+            fig.clf()
+
+    def altair_chart(self, chart, **kwargs):
+        self.elements += 1
+        chart.to_dict()
+
+    def cache_data(self, func=None, **kwargs):
+        if func is None:
+            return self.cache_data
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                key = (func.__module__, func.__qualname__, pickle.dumps((args, kwargs)))
+            except Exception:
+                return func(*args, **kwargs)
+            if key not in self.cached:
+                self.cached[key] = func(*args, **kwargs)
+            return self.cached[key]
+
+        wrapper.clear = self.cached.clear
+        return wrapper
+
+    cache_resource = cache_data
+    cache = cache_data
+    experimental_memo = cache_data
+    experimental_singleton = cache_data
+
+    def _widget(self, kind, *args, **kwargs):
+        params = dict(zip(WIDGET_PARAMS[kind], args))
+        params.update(kwargs)
+        key = params.get("key") or f"{kind}:{params.get('label', '')}"
+        self.seen_widgets[key] += 1
+        if self.seen_widgets[key] > 1:
+            key = f"{key}#{self.seen_widgets[key]}"
+
+        default = default_value(kind, params)
+        self.widgets[key] = Widget(kind, params, default)
+        if key in self.overrides:
+            value = self.overrides[key]
+        elif params.get("key") in self.session_state and kind not in BUTTON_KINDS:
+            value = self.session_state[params["key"]]
+        else:
+            value = default
+        if params.get("key"):
+            self.session_state[params["key"]] = value
+        return value
+
+
+for _kind in WIDGET_PARAMS:
+    setattr(SimulatedStreamlit, _kind, partialmethod(SimulatedStreamlit._widget, _kind))
+
+
+def default_value(kind, params):
+    value = params.get("value")
+    if kind == "slider":
+        if value is not None:
+            return value
+        return params.get("min_value") if params.get("min_value") is not None else 0
+    if kind == "number_input":
+        if value is not None:
+            return value
+        return params.get("min_value") if params.get("min_value") is not None else 0.0
+    if kind == "select_slider":
+        return value if value is not None else list(params.get("options", [None]))[0]
+    if kind in ["selectbox", "radio"]:
+        options = list(params.get("options", []))
+        return options[params.get("index") or 0] if options else None
+    if kind == "multiselect":
+        default = params.get("default")
+        if default is None:
+            return []
+        return list(default) if isinstance(default, (list, tuple)) else [default]
+    if kind in ["text_input", "text_area"]:
+        return value or ""
+    if kind == "checkbox":
+        return bool(value)
+    if kind == "date_input":
+        return value or datetime.date.today()
+    if kind == "time_input":
+        return value or datetime.datetime.now().time()
+    if kind == "color_picker":
+        return value or "#000000"
+    if kind == "file_uploader":
+        return [] if params.get("accept_multiple_files") else None
+    return False
+
+
+def sweep_values(widget, uploads, limit):
+    kind, params, default = widget
+    if kind in ["slider", "number_input"]:
+        low, high = params.get("min_value"), params.get("max_value")
+        if low is None or high is None:
+            return [default * 2 or 1] if isinstance(default, (int, float)) else []
+        middle = (low + high) / 2
+        if isinstance(low, int) and isinstance(high, int):
+            middle = int(middle)
+        if isinstance(default, (tuple, list)):
+            return [(low, high), (low, middle), (middle, high)]
+        return [low, middle, high]
+    if kind in ["selectbox", "radio", "select_slider"]:
+        return list(params.get("options", []))[:limit]
+    if kind == "multiselect":
+        options = list(params.get("options", []))
+        return [[], options[:1], options[:limit]]
+    if kind == "checkbox":
+        return [not default]
+    if kind in ["text_input", "text_area"]:
+        return ["simulated input"]
+    if kind in BUTTON_KINDS:
+        return [True]
+    if kind == "file_uploader":
+        if params.get("accept_multiple_files"):
+            return [[UploadedFile(path) for path in uploads]] if uploads else []
+        return [UploadedFile(path) for path in uploads[:limit]]
+    return []
+
+
+class Simulator:
+    def __init__(self, path, uploads=(), limit=5, trace_memory=True):
+        self.path = Path(path)
+        self.code = compile(self.path.read_text(), str(self.path), "exec")
+        self.uploads = list(uploads)
+        self.limit = limit
+        self.trace_memory = trace_memory
+        self.st = SimulatedStreamlit()
+
+    def rerun(self, step):
+        import matplotlib.pyplot as plt
+
+        self.st.start_run()
+        namespace = {"__name__": "__main__", "__file__": str(self.path)}
+        error = None
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            exec(self.code, namespace)
+        except StopRun:
+            pass
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else 0
+        return RerunResult(
+            step, seconds, peak, self.st.figures, len(plt.get_fignums()), error
+        )
+
+    def change(self, key, value):
+        # Streamlit runs the widget callback before the rerun
+        widget = self.st.widgets[key]
+        self.st.overrides = {key: value}
+        if widget.params.get("key"):
+            self.st.session_state[widget.params["key"]] = value
+        callback = widget.params.get(
+            "on_click" if widget.kind in BUTTON_KINDS else "on_change"
+        )
+        if callback:
+            callback(*widget.params.get("args", ()), **widget.params.get("kwargs", {}))
+
+    def sweep(self):
+        sys.modules["streamlit"] = self.st
+        sys.path.insert(0, str(self.path.parent))
+        if self.trace_memory:
+            tracemalloc.start()
+        try:
+            yield self.rerun("defaults")
+            for key, widget in list(self.st.widgets.items()):
+                for value in sweep_values(widget, self.uploads, self.limit):
+                    try:
+                        self.change(key, value)
+                    except Exception as e:
+                        yield RerunResult(
+                            f"{key}={value!r}", 0.0, 0, 0, 0, f"callback: {e}"
+                        )
+                        continue
+                    yield self.rerun(f"{key}={value!r}")
+                self.st.overrides = {}
+        finally:
+            if self.trace_memory:
+                tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure reruns of a generated app without a Streamlit server"
+    )
+    parser.add_argument("app", nargs="?", default="pages/output.py")
+    parser.add_argument(
+        "--upload", action="append", default=[], help="File fed to file_uploader"
+    )
+    parser.add_argument(
+        "--values", type=int, default=5, help="Options tried per select widget"
+    )
+    parser.add_argument("--max-rerun-ms", type=float)
+    parser.add_argument("--max-peak-mb", type=float)
+    parser.add_argument("--max-figures", type=int)
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip tracemalloc, which slows the measured reruns down",
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON lines")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    simulator = Simulator(
+        args.app, args.upload, limit=args.values, trace_memory=not args.no_memory
+    )
+
+    failures = []
+    for result in simulator.sweep():
+        if args.json:
+            print(json.dumps(result._asdict()), flush=True)
+        else:
+            print(
+                f"{result.seconds * 1000:9.1f} ms {result.peak_bytes / 2**20:8.1f} MB "
+                f"{result.figures:3d} fig  {result.step}"
+                + (f"  [{result.error}]" if result.error else ""),
+                flush=True,
+            )
+        if result.error:
+            failures.append(f"{result.step}: {result.error}")
+        if args.max_rerun_ms is not None and result.seconds * 1000 > args.max_rerun_ms:
+            failures.append(f"{result.step}: {result.seconds * 1000:.1f} ms")
+        if (
+            args.max_peak_mb is not None
+            and result.peak_bytes / 2**20 > args.max_peak_mb
+        ):
+            failures.append(f"{result.step}: {result.peak_bytes / 2**20:.1f} MB")
+        if args.max_figures is not None and result.figures > args.max_figures:
+            failures.append(f"{result.step}: {result.figures} figures")
+
+    if failures:
+        print("\nBudget exceeded:", file=sys.stderr)
+        for failure in failures:
+            print(f"  {failure}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
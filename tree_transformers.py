@@ -1,9 +1,99 @@
 import ast
+import copy
+from bisect import bisect_right
+
 import matplotlib.colors as mcolors
 
+# Names that have to appear in a notebook for a rewrite to apply
+FEATURE_NAMES = {
+    "widgets": [
+        "ipywidgets",
+        "widgets",
+        "IntSlider",
+        "FloatSlider",
+        "IntRangeSlider",
+        "FloatRangeSlider",
+        "BoundedIntText",
+        "BoundedFloatText",
+        "IntText",
+        "FloatText",
+        "Text",
+        "Password",
+        "Textarea",
+        "Checkbox",
+        "Dropdown",
+        "RadioButtons",
+        "SelectionSlider",
+        "SelectMultiple",
+        "TagsInput",
+        "DatePicker",
+        "TimePicker",
+        "ColorPicker",
+        "Image",
+        "Button",
+        "ToggleButton",
+    ],
+    "interactive": ["interactive", "interact_manual"],
+    "on_click": ["on_click"],
+    "observe": ["observe"],
+    "file_upload": ["FileUpload"],
+    "plotting": ["figure", "show", "plot", "scatter"],
+    "display": ["display"],
+    "magics": ["get_ipython"],
+}
+
+# st.* calls whose value depends on what the visitor did
+STREAMLIT_WIDGETS = [
+    "button",
+    "checkbox",
+    "color_picker",
+    "date_input",
+    "file_uploader",
+    "multiselect",
+    "number_input",
+    "radio",
+    "select_slider",
+    "selectbox",
+    "slider",
+    "text_area",
+    "text_input",
+    "time_input",
+]
+
+# A runtime import for st.* calls a pass adds to code that may not have the
+# ipywidgets import the widget rewrite turns into import streamlit as st
+STREAMLIT_IMPORT = ("streamlit", "st")
+
 
 class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
-    def __init__(self):
+    visitor_features = {
+        "visit_Import": {"widgets"},
+        "visit_ImportFrom": {"widgets"},
+        "visit_Assign": {"widgets", "interactive", "plotting", "file_upload"},
+        "visit_Expr": {
+            "widgets",
+            "interactive",
+            "plotting",
+            "on_click",
+            "observe",
+            "display",
+            "magics",
+        },
+        "visit_Attribute": {"widgets", "interactive", "file_upload"},
+        "visit_FunctionDef": {"interactive"},
+        "visit_Call": {"interactive"},
+        "visit_If": {"file_upload"},
+    }
+
+    def __init__(self, features=None, resize_images=False):
+        if features is not None:
+            # Visitors whose features the notebook lacks cannot change anything
+            for visitor, required in self.visitor_features.items():
+                if not required & features:
+                    setattr(self, visitor, self.generic_visit)
+        self.resize_images = resize_images
+        self.runtime_imports = set()
+        self.interactive_defaults = {}
         self.ipywidgets_alias = "widgets"
         self.file_upload_vars = {}
         self.fig_vars = []
@@ -11,6 +101,11 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
         self.converted_functions = {}
         self.file_upload_variables = set()
         self.transformed_variables = set()
+        self.manual_results = {}
+        self.run_button_keys = set()
+        self.observers = {}
+        self.restored_globals = set()
+        self.rewritten_handlers = []
         self.args_translation = {
             "description": "label",
             "min": "min_value",
@@ -47,10 +142,169 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
             "TagsInput",
         ]
         self.supported_button_types = ["ToggleButton"]
+        # Assigned names whose .value reads and display() calls get rewritten
+        self.recorded_widget_types = (
+            self.supported_slider_types
+            + self.supported_number_input_types
+            + self.supported_text_types
+            + self.supported_multiselect_types
+            + self.supported_button_types
+            + [
+                "Checkbox",
+                "Dropdown",
+                "RadioButtons",
+                "SelectionSlider",
+                "DatePicker",
+                "TimePicker",
+                "ColorPicker",
+                "Image",
+            ]
+        )
+
+    def visit(self, node):
+        new_node = super().visit(node)
+        if isinstance(node, ast.stmt):
+            # Keep the source location of rewritten statements
+            for statement in new_node if isinstance(new_node, list) else [new_node]:
+                if statement is not None and not hasattr(statement, "lineno"):
+                    ast.copy_location(statement, node)
+        return new_node
 
     def visit_Module(self, node):
         self.module_body = node.body
-        return self.generic_visit(node)
+        node = self.generic_visit(node)
+        for widget_var, handlers in self.observers.items():
+            self._attach_on_change(node.body, widget_var, handlers)
+        return node
+
+    def collect_facts(self, module, shard_starts):
+        # First phase of a sharded run: replay the bookkeeping later rewrites
+        # depend on and snapshot it at each shard start. Returns None when the
+        # module needs a whole-module rewrite.
+        self.module_body = module.body
+        snapshots = []
+        on_click_bindings = []
+        for index, statement in enumerate(module.body):
+            if index in shard_starts:
+                snapshots.append(self._facts())
+            if not self._collect(statement, index, on_click_bindings):
+                return None
+        return snapshots, on_click_bindings
+
+    def _facts(self):
+        return {
+            "ipywidgets_alias": self.ipywidgets_alias,
+            "fig_vars": list(self.fig_vars),
+            "converted_functions": list(self.converted_functions),
+            "transformed_variables": set(self.transformed_variables),
+            "file_upload_vars": dict(self.file_upload_vars),
+            "manual_results": dict(self.manual_results),
+            "run_button_keys": set(self.run_button_keys),
+        }
+
+    def _visits(self, visitor):
+        return getattr(self, visitor) != self.generic_visit
+
+    def _collect(self, node, index, on_click_bindings):
+        top_level = node is self.module_body[index]
+        if isinstance(node, ast.ImportFrom) and self._visits("visit_ImportFrom"):
+            if node.module == "ipywidgets":
+                if not top_level:
+                    return False
+                self.ipywidgets_alias = None
+        elif isinstance(node, ast.Assign) and self._visits("visit_Assign"):
+            self._record_assign(node)
+            value = node.value
+            if (
+                isinstance(value, ast.Call)
+                and isinstance(value.func, ast.Name)
+                and value.func.id in ["interactive", "interact_manual"]
+                and self._is_manual_interactive(value)
+            ):
+                self._run_button_key(value.args[0].id)
+        elif isinstance(node, ast.Expr) and self._visits("visit_Expr"):
+            value = node.value
+            if self._is_plt_call(value, "show"):
+                if self.fig_vars:
+                    self.fig_vars.pop(0)
+            elif (
+                isinstance(value, ast.Call)
+                and isinstance(value.func, ast.Attribute)
+                and value.func.attr == "on_click"
+            ):
+                if not top_level:
+                    return False
+                # The button assignment may live in another shard
+                button_var = value.func.value.id
+                for target, n in enumerate(self.module_body):
+                    if isinstance(n, ast.Assign) and n.targets[0].id == button_var:
+                        on_click_bindings.append((index, target))
+                        break
+            elif (
+                isinstance(value, ast.Call)
+                and isinstance(value.func, ast.Attribute)
+                and value.func.attr == "observe"
+            ):
+                return False
+            elif (
+                isinstance(value, ast.Call)
+                and isinstance(value.func, ast.Name)
+                and value.func.id == "interact_manual"
+            ):
+                self._run_button_key(value.args[0].id)
+        elif isinstance(node, ast.FunctionDef) and self._visits("visit_FunctionDef"):
+            self.converted_functions[node.name] = node
+            for child in node.body:
+                if not self._collect(child, index, on_click_bindings):
+                    return False
+            if any(map(self._is_interact_manual_decorator, node.decorator_list)):
+                self._run_button_key(node.name)
+            return True
+
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.stmt, ast.excepthandler, ast.match_case)):
+                if not self._collect(child, index, on_click_bindings):
+                    return False
+        return True
+
+    def transform_range(self, module, start, end, facts, on_click_bindings=()):
+        # Second phase: rewrite module.body[start:end] like visit_Module would,
+        # starting from the facts collected up to start. on_click calls in other
+        # shards are replayed on the button assignments of this one.
+        self.module_body = module.body
+        for name, value in facts.items():
+            setattr(self, name, value)
+        self.converted_functions = dict.fromkeys(facts["converted_functions"])
+        before = []
+        after = []
+        for expr_index, target_index in on_click_bindings:
+            if not start <= target_index < end or start <= expr_index < end:
+                continue
+            binding = (
+                module.body[target_index],
+                module.body[expr_index].value.args[0],
+            )
+            (before if expr_index < start else after).append(binding)
+
+        for target, callback in before:
+            target.value = self._process_button_call(target.value, callback)
+        new_body = []
+        index = start
+        while index < end:
+            length = len(self.module_body)
+            value = self.visit(self.module_body[index])
+            # visit_ImportFrom inserts statements right after the current one
+            end += len(self.module_body) - length
+            index += 1
+            if value is None:
+                continue
+            if isinstance(value, ast.AST):
+                new_body.append(value)
+            else:
+                new_body.extend(value)
+        for target, callback in after:
+            target.value = self._process_button_call(target.value, callback)
+        return new_body
 
     def visit_Import(self, node):
         return self._process_import(node)
@@ -65,81 +319,86 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
         return self.generic_visit(node)
 
     def visit_Assign(self, node):
-        if (
-            isinstance(node.value, ast.Call)
-            and isinstance(node.value.func, ast.Attribute)
-            and node.value.func.attr == "figure"
-            and isinstance(node.value.func.value, ast.Name)
-            and node.value.func.value.id == "plt"
-        ):
-            self.fig_vars.append(node.targets[0].id)
-
+        self._record_assign(node)
         if isinstance(node.value, ast.Call):
             value = node.value
             func = value.func
-            identifier = node.targets[0].id
             if self._is_ipywidgets_button(func):
                 node.value = self._process_button_call(node.value)
                 return node
             if hasattr(func, "id"):
-                if func.id == "interactive":
-                    self.transformed_variables.add(identifier)
+                if func.id in ["interactive", "interact_manual"]:
                     return self._process_interactive(node)
             if hasattr(func, "attr"):
                 if func.attr in self.supported_slider_types:
-                    self.transformed_variables.add(identifier)
                     return self._process_slider(node)
                 if func.attr in self.supported_number_input_types:
-                    self.transformed_variables.add(identifier)
                     return self._process_number_input(node)
                 if func.attr in self.supported_text_types:
-                    self.transformed_variables.add(identifier)
                     text_type = "text_area" if func.attr == "Textarea" else "text_input"
                     return self._process_text_input(node, text_type)
                 if func.attr == "Checkbox":
-                    self.transformed_variables.add(identifier)
                     return self._process_checkbox(node)
                 if func.attr == "Dropdown":
-                    self.transformed_variables.add(identifier)
                     return self._process_dropdown(node)
                 if func.attr == "RadioButtons":
-                    self.transformed_variables.add(identifier)
                     return self._process_radio(node)
                 if func.attr == "SelectionSlider":
-                    self.transformed_variables.add(identifier)
                     return self._process_selection_slider(node)
                 if func.attr in self.supported_multiselect_types:
-                    self.transformed_variables.add(identifier)
                     return self._process_multiselect(node)
                 if func.attr == "DatePicker":
-                    self.transformed_variables.add(identifier)
                     return self._process_datepicker(node)
                 if func.attr == "TimePicker":
-                    self.transformed_variables.add(identifier)
                     return self._process_time_picker(node)
                 if func.attr == "ColorPicker":
-                    self.transformed_variables.add(identifier)
                     return self._process_color_picker(node)
                 if func.attr == "Image":
-                    self.transformed_variables.add(identifier)
                     return self._process_image(node, is_assign=True)
                 if func.attr == "FileUpload":
                     return self._process_file_upload(node)
                 if func.attr in self.supported_button_types:
-                    self.transformed_variables.add(identifier)
                     return self._process_button(node)
         return self.generic_visit(node)
 
-    def visit_Expr(self, node):
-        if (
-            isinstance(node.value, ast.Call)
-            and isinstance(node.value.func, ast.Attribute)
-            and node.value.func.attr == "show"
-            and isinstance(node.value.func.value, ast.Name)
-            and node.value.func.value.id == "plt"
+    def _record_assign(self, node):
+        # Names later statements depend on, shared with collect_facts
+        target = node.targets[0]
+        if self._is_plt_call(node.value, "figure"):
+            self.fig_vars.append(target.id)
+        elif (
+            self._is_plt_call(node.value, "subplots")
+            and isinstance(target, ast.Tuple)
+            and isinstance(target.elts[0], ast.Name)
         ):
+            # fig, ax = plt.subplots()
+            self.fig_vars.append(target.elts[0].id)
+        if not isinstance(node.value, ast.Call) or not isinstance(target, ast.Name):
+            return
+        func = node.value.func
+        identifier = target.id
+        if self._is_ipywidgets_button(func):
+            return
+        if hasattr(func, "id") and func.id in ["interactive", "interact_manual"]:
+            self.transformed_variables.add(identifier)
+            if self._is_manual_interactive(node.value):
+                function_name = node.value.args[0].id
+                # The button key the call is about to take
+                button_key = self._run_button_key(function_name, reserve=False)
+                self.manual_results[identifier] = self._result_key(
+                    function_name, button_key
+                )
+        elif hasattr(func, "attr"):
+            if func.attr == "FileUpload":
+                self.file_upload_vars[identifier] = identifier
+            elif func.attr in self.recorded_widget_types:
+                self.transformed_variables.add(identifier)
+
+    def visit_Expr(self, node):
+        if self._is_plt_call(node.value, "show"):
             if self.fig_vars:
                 fig_var = self.fig_vars.pop(0)
+                self.runtime_imports.add(STREAMLIT_IMPORT)
                 return ast.Expr(
                     value=ast.Call(
                         func=ast.Attribute(
@@ -171,6 +430,14 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
 
             # Remove the on_click Expr node
             return None
+        if (
+            isinstance(node.value, ast.Call)
+            and isinstance(node.value.func, ast.Attribute)
+            and node.value.func.attr == "observe"
+            and isinstance(node.value.func.value, ast.Name)
+            and node.value.args
+        ):
+            return self._process_observe(node)
         if (
             isinstance(node.value, ast.Call)
             and isinstance(node.value.func, ast.Attribute)
@@ -180,6 +447,13 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
         ):
             return None
 
+        if (
+            isinstance(node.value, ast.Call)
+            and isinstance(node.value.func, ast.Name)
+            and node.value.func.id == "interact_manual"
+        ):
+            return self._process_interactive(node)
+
         if isinstance(node.value, ast.Call):
             if hasattr(node.value.func, "attr") and node.value.func.attr == "display":
                 return self._process_display(node)
@@ -194,7 +468,13 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
         return self.generic_visit(node)
 
     def visit_Attribute(self, node):
-        print("visiting attribute", node.value)
+        if (
+            isinstance(node.value, ast.Name)
+            and node.value.id in self.manual_results
+            and node.attr == "result"
+        ):
+            return self._session_state_get(self.manual_results[node.value.id])
+
         if (
             isinstance(node.value, ast.Name)
             and node.value.id in self.transformed_variables
@@ -238,7 +518,24 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
 
     def visit_FunctionDef(self, node):
         self.converted_functions[node.name] = node
-        return self.generic_visit(node)
+        manual_decorators = [
+            decorator
+            for decorator in node.decorator_list
+            if self._is_interact_manual_decorator(decorator)
+        ]
+        if not manual_decorators:
+            return self.generic_visit(node)
+
+        # @interact_manual(...) behaves like interact_manual(f, ...) after the def
+        decorator = manual_decorators[0]
+        node.decorator_list.remove(decorator)
+        interact_call = ast.Call(
+            func=ast.Name(id="interact_manual", ctx=ast.Load()),
+            args=[ast.Name(id=node.name, ctx=ast.Load())],
+            keywords=decorator.keywords if isinstance(decorator, ast.Call) else [],
+        )
+        node = self.generic_visit(node)
+        return [node] + self._process_interactive(ast.Expr(value=interact_call))
 
     def visit_Call(self, node):
         # Check if the function being called is the interactive function
@@ -294,6 +591,15 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
             )
         return self.generic_visit(node)
 
+    def _is_plt_call(self, value, attr):
+        return (
+            isinstance(value, ast.Call)
+            and isinstance(value.func, ast.Attribute)
+            and value.func.attr == attr
+            and isinstance(value.func.value, ast.Name)
+            and value.func.value.id == "plt"
+        )
+
     def _is_ipywidgets_button(self, func):
         return (
             isinstance(func, ast.Attribute)
@@ -302,6 +608,65 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
             and func.value.id == self.ipywidgets_alias
         )
 
+    def _is_interact_manual_decorator(self, decorator):
+        if isinstance(decorator, ast.Call):
+            decorator = decorator.func
+        return isinstance(decorator, ast.Name) and decorator.id == "interact_manual"
+
+    def _is_manual_interactive(self, call):
+        if isinstance(call.func, ast.Name) and call.func.id == "interact_manual":
+            return True
+        if self._manual_options(call).get("manual") is True:
+            return True
+        # Widgets marked continuous_update=False are costly to recompute
+        for kw in call.keywords:
+            if isinstance(kw.value, ast.Call) and any(
+                widget_kw.arg == "continuous_update"
+                and isinstance(widget_kw.value, ast.Constant)
+                and widget_kw.value.value is False
+                for widget_kw in kw.value.keywords
+            ):
+                return True
+        return False
+
+    def _manual_options(self, call):
+        # interactive(f, {"manual": True, "manual_name": "Go"}, x=...)
+        options = {}
+        for arg in call.args[1:]:
+            if isinstance(arg, ast.Dict):
+                for key, value in zip(arg.keys, arg.values):
+                    if isinstance(key, ast.Constant) and isinstance(
+                        value, ast.Constant
+                    ):
+                        options[key.value] = value.value
+        return options
+
+    def _result_key(self, function_name, button_key):
+        # f_run__ keeps its result in f_result__, each manual interactive of the
+        # same function has its own
+        return f"{function_name}_result{button_key[len(function_name) + 4:]}"
+
+    def _session_state(self):
+        return ast.Attribute(
+            value=ast.Name(id="st", ctx=ast.Load()),
+            attr="session_state",
+            ctx=ast.Load(),
+        )
+
+    def _session_state_get(self, key):
+        return ast.Call(
+            func=ast.Attribute(value=self._session_state(), attr="get", ctx=ast.Load()),
+            args=[ast.Str(s=key)],
+            keywords=[],
+        )
+
+    def _session_state_item(self, key, ctx=None):
+        return ast.Subscript(
+            value=self._session_state(),
+            slice=ast.Index(value=ast.Str(s=key)),
+            ctx=ctx or ast.Load(),
+        )
+
     def _process_image(self, node, is_assign):
         st_image = ast.Attribute(
             value=ast.Name(id="st", ctx=ast.Load()),
@@ -311,19 +676,31 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
 
         keywords = []
 
-        for kw in node.value.keywords:
-            if kw.arg == "value":
-                kw.arg = "image"
-            elif kw.arg == "format":
-                kw.arg = "output_format"
-            elif kw.arg in ["height", "width"]:
-                continue  # Skip the 'height' and 'width' keywords
-            keywords.append(kw)
-
-        # Add use_column_width argument to use the full column width
-        keywords.append(
-            ast.keyword(arg="use_column_width", value=ast.NameConstant(value=True))
-        )
+        sizes = [kw for kw in node.value.keywords if kw.arg in ["height", "width"]]
+        value = [kw.value for kw in node.value.keywords if kw.arg == "value"]
+        if self.resize_images and sizes and value:
+            # Resize once on the server instead of shipping full-size images
+            self.runtime_imports.add(("converter_runtime.images", "fit_image"))
+            fit_image = ast.Call(
+                func=ast.Name(id="fit_image", ctx=ast.Load()),
+                args=value,
+                keywords=sizes,
+            )
+            keywords.append(ast.keyword(arg=None, value=fit_image))
+        else:
+            for kw in node.value.keywords:
+                if kw.arg == "value":
+                    kw.arg = "image"
+                elif kw.arg == "format":
+                    kw.arg = "output_format"
+                elif kw.arg in ["height", "width"]:
+                    continue  # Skip the 'height' and 'width' keywords
+                keywords.append(kw)
+
+            # Add use_column_width argument to use the full column width
+            keywords.append(
+                ast.keyword(arg="use_column_width", value=ast.NameConstant(value=True))
+            )
 
         st_image_call = ast.Call(func=st_image, args=[], keywords=keywords)
         if is_assign:
@@ -484,7 +861,6 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
 
     def _process_file_upload(self, node):
         var_name = node.targets[0].id
-        self.file_upload_vars[var_name] = var_name
         description = None
         for keyword in node.value.keywords:
             if keyword.arg == "description":
@@ -838,6 +1214,179 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
         )
         return ast.Expr(value=st_write_call)
 
+    def _process_observe(self, node):
+        call = node.value
+        widget_var = call.func.value.id
+        handler = call.args[0]
+        names = call.args[1] if len(call.args) > 1 else None
+        for kw in call.keywords:
+            if kw.arg == "names":
+                names = kw.value
+
+        if isinstance(names, (ast.List, ast.Tuple)) and len(names.elts) == 1:
+            names = names.elts[0]
+        if names is not None and not (
+            isinstance(names, ast.Constant) and names.value == "value"
+        ):
+            print(f"Warning: only value changes of '{widget_var}' can be observed")
+            return None
+
+        if isinstance(handler, ast.Name):
+            for n in self.module_body:
+                if isinstance(n, ast.FunctionDef) and n.name == handler.id:
+                    handler = n
+                    break
+        if self._uses_change_owner(handler):
+            # The Streamlit widget returns a plain value, there is no owner
+            print(
+                f"Warning: the handler of '{widget_var}' reads change.owner, "
+                "not converted"
+            )
+            return None
+        self.observers.setdefault(widget_var, []).append(handler)
+
+        # Downstream code reads whatever the handler stored on the last change
+        restore_statements = []
+        for name in self._handler_globals(handler):
+            if name in self.restored_globals:
+                continue
+            self.restored_globals.add(name)
+            restore_statements.append(
+                ast.If(
+                    test=ast.Compare(
+                        left=ast.Str(s=name),
+                        ops=[ast.In()],
+                        comparators=[self._session_state()],
+                    ),
+                    body=[
+                        ast.Assign(
+                            targets=[ast.Name(id=name, ctx=ast.Store())],
+                            value=self._session_state_item(name),
+                        )
+                    ],
+                    orelse=[],
+                )
+            )
+        return restore_statements or None
+
+    def _handler_globals(self, handler):
+        if not isinstance(handler, ast.FunctionDef):
+            return []
+        names = []
+        for n in ast.walk(handler):
+            if isinstance(n, ast.Global):
+                names.extend(name for name in n.names if name not in names)
+        return names
+
+    def _uses_change_owner(self, handler):
+        if not isinstance(handler, (ast.FunctionDef, ast.Lambda)):
+            return False
+        if not handler.args.args:
+            return False
+        change_arg = handler.args.args[0].arg
+        for n in ast.walk(handler):
+            if isinstance(n, ast.Attribute):
+                key = n.attr
+            elif isinstance(n, ast.Subscript) and isinstance(n.slice, ast.Constant):
+                key = n.slice.value
+            else:
+                continue
+            if key == "owner" and isinstance(n.value, ast.Name):
+                if n.value.id == change_arg:
+                    return True
+        return False
+
+    def _attach_on_change(self, body, widget_var, handlers):
+        for n in body:
+            if (
+                isinstance(n, ast.Assign)
+                and isinstance(n.targets[0], ast.Name)
+                and n.targets[0].id == widget_var
+                and isinstance(n.value, ast.Call)
+                and isinstance(n.value.func, ast.Attribute)
+                and isinstance(n.value.func.value, ast.Name)
+                and n.value.func.value.id == "st"
+            ):
+                widget_call = n.value
+                break
+        else:
+            print(f"Warning: observed widget '{widget_var}' was not converted")
+            return
+
+        if not any(kw.arg == "key" for kw in widget_call.keywords):
+            widget_call.keywords.append(
+                ast.keyword(arg="key", value=ast.Str(s=widget_var))
+            )
+
+        # Streamlit callbacks take no arguments, rebuild the ipywidgets change
+        change = ast.Dict(
+            keys=[
+                ast.Str(s="name"),
+                ast.Str(s="old"),
+                ast.Str(s="new"),
+                ast.Str(s="type"),
+            ],
+            values=[
+                ast.Str(s="value"),
+                ast.Name(id=widget_var, ctx=ast.Load()),
+                self._session_state_item(widget_var),
+                ast.Str(s="change"),
+            ],
+        )
+        handler_calls = [
+            ast.Call(func=self._rewrite_handler(handler), args=[change], keywords=[])
+            for handler in handlers
+        ]
+        on_change = ast.Lambda(
+            args=ast.arguments(
+                posonlyargs=[],
+                args=[],
+                vararg=None,
+                kwonlyargs=[],
+                kw_defaults=[],
+                kwarg=None,
+                defaults=[],
+            ),
+            body=handler_calls[0]
+            if len(handler_calls) == 1
+            else ast.Tuple(elts=handler_calls, ctx=ast.Load()),
+        )
+        widget_call.keywords.append(ast.keyword(arg="on_change", value=on_change))
+
+    def _rewrite_handler(self, handler):
+        observed_vars = set(self.observers)
+        if isinstance(handler, ast.FunctionDef):
+            if handler not in self.rewritten_handlers:
+                self.rewritten_handlers.append(handler)
+                change_arg = handler.args.args[0].arg if handler.args.args else None
+                ObserveHandlerTransformer(change_arg, observed_vars).visit(handler)
+                stores = [
+                    ast.Assign(
+                        targets=[self._session_state_item(name, ctx=ast.Store())],
+                        value=ast.Name(id=name, ctx=ast.Load()),
+                    )
+                    for name in self._handler_globals(handler)
+                ]
+                if stores:
+                    # Saved on every way out, also after an early return. The
+                    # global statements stay in front.
+                    body = handler.body
+                    head = 0
+                    while head < len(body) and isinstance(body[head], ast.Global):
+                        head += 1
+                    handler.body = body[:head] + [
+                        ast.Try(
+                            body=body[head:], handlers=[], orelse=[], finalbody=stores
+                        )
+                    ]
+            return ast.Name(id=handler.name, ctx=ast.Load())
+        if isinstance(handler, ast.Lambda) and handler.args.args:
+            change_arg = handler.args.args[0].arg
+            handler.body = ObserveHandlerTransformer(change_arg, observed_vars).visit(
+                handler.body
+            )
+        return handler
+
     def _process_import(self, node):
         if any(alias.name == "ipywidgets" for alias in node.names):
             return ast.Import(names=[ast.alias(name="streamlit", asname="st")])
@@ -863,6 +1412,7 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
         ):
             arg_defaults[arg.arg] = default
 
+        initial_values = {}
         for kw in node.value.keywords:
             slider_name = kw.arg
             slider = kw.value
@@ -906,6 +1456,11 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
                 targets=[ast.Name(id=slider_name, ctx=ast.Store())], value=slider_call
             )
             new_statements.append(slider_assign)
+            initial_values[slider_name] = self._initial_value(keywords)
+
+        # What the first visitor sees, used to warm up caches at deploy time
+        if None not in initial_values.values():
+            self.interactive_defaults.setdefault(function_name, initial_values)
 
         function_call = ast.Expr(
             value=ast.Call(
@@ -918,5 +1473,1218 @@ class IpywidgetsToStreamlitTransformer(ast.NodeTransformer):
             )
         )
 
-        new_statements.append(function_call)
+        if self._is_manual_interactive(node.value):
+            new_statements += self._process_manual_call(node.value, function_call)
+        else:
+            new_statements.append(function_call)
         return new_statements
+
+    def _initial_value(self, keywords):
+        # st.slider starts at value, or at min_value when there is none
+        values = {keyword.arg: keyword.value for keyword in keywords}
+        value = values.get("value", values.get("min_value"))
+        try:
+            return ast.literal_eval(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def _run_button_key(self, function_name, reserve=True):
+        button_key = f"{function_name}_run"
+        while button_key in self.run_button_keys:
+            button_key += "_"
+        if reserve:
+            self.run_button_keys.add(button_key)
+        return button_key
+
+    def _process_manual_call(self, call, function_call):
+        function_name = call.args[0].id
+        label = self._manual_options(call).get("manual_name", "Run")
+        button_key = self._run_button_key(function_name)
+        result_key = self._result_key(function_name, button_key)
+        run_button = ast.Call(
+            func=ast.Attribute(
+                value=ast.Name(id="st", ctx=ast.Load()), attr="button", ctx=ast.Load()
+            ),
+            args=[ast.Str(s=label)],
+            keywords=[ast.keyword(arg="key", value=ast.Str(s=button_key))],
+        )
+        # Keep the last result so other reruns can reuse it
+        store_result = ast.Assign(
+            targets=[
+                self._session_state_item(result_key, ctx=ast.Store())
+            ],
+            value=function_call.value,
+        )
+        # Magic displayed the bare call, keep showing the last result until the
+        # next Run instead of only on the rerun the button was pressed
+        show_result = ast.If(
+            test=ast.Compare(
+                left=self._session_state_get(result_key),
+                ops=[ast.IsNot()],
+                comparators=[ast.Constant(value=None)],
+            ),
+            body=[
+                ast.Expr(
+                    value=ast.Call(
+                        func=ast.Attribute(
+                            value=ast.Name(id="st", ctx=ast.Load()),
+                            attr="write",
+                            ctx=ast.Load(),
+                        ),
+                        args=[self._session_state_item(result_key)],
+                        keywords=[],
+                    )
+                )
+            ],
+            orelse=[],
+        )
+        return [ast.If(test=run_button, body=[store_result], orelse=[]), show_result]
+
+
+class ObserveHandlerTransformer(ast.NodeTransformer):
+    def __init__(self, change_arg, observed_vars):
+        self.change_arg = change_arg
+        self.observed_vars = observed_vars
+        # Handlers reading change.owner are not converted
+        self.change_attrs = ["name", "old", "new", "type"]
+
+    def visit_FunctionDef(self, node):
+        # Locals shadowing an observed widget keep their meaning
+        assigned = {
+            n.id
+            for n in ast.walk(node)
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)
+        }
+        self.observed_vars = self.observed_vars - assigned
+        return self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        # change.new -> change["new"], the change is passed as a plain dict
+        if (
+            isinstance(node.value, ast.Name)
+            and node.value.id == self.change_arg
+            and node.attr in self.change_attrs
+        ):
+            return ast.Subscript(
+                value=node.value,
+                slice=ast.Index(value=ast.Str(s=node.attr)),
+                ctx=node.ctx,
+            )
+        return self.generic_visit(node)
+
+    def visit_Name(self, node):
+        # The callback runs before the rerun, so read the fresh widget value
+        if node.id in self.observed_vars and isinstance(node.ctx, ast.Load):
+            return ast.Subscript(
+                value=ast.Attribute(
+                    value=ast.Name(id="st", ctx=ast.Load()),
+                    attr="session_state",
+                    ctx=ast.Load(),
+                ),
+                slice=ast.Index(value=ast.Str(s=node.id)),
+                ctx=ast.Load(),
+            )
+        return node
+
+
+class PlotDownsamplingTransformer(ast.NodeTransformer):
+    def __init__(self):
+        self.plot_methods = ["plot", "scatter"]
+        self.axes_factories = ["add_axes", "add_subplot", "axes", "gca", "subplots"]
+        self.axes_vars = set()
+        self.runtime_imports = set()
+
+    def visit_Module(self, node):
+        for n in ast.walk(node):
+            if (
+                isinstance(n, ast.Assign)
+                and isinstance(n.value, ast.Call)
+                and isinstance(n.value.func, ast.Attribute)
+                and n.value.func.attr in self.axes_factories
+            ):
+                for target in n.targets:
+                    # fig, ax = plt.subplots() binds the axes to the last name
+                    if isinstance(target, ast.Tuple) and target.elts:
+                        target = target.elts[-1]
+                    if isinstance(target, ast.Name):
+                        self.axes_vars.add(target.id)
+        return self.generic_visit(node)
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not self._is_plot_call(node):
+            return node
+        if any(isinstance(arg, ast.Starred) for arg in node.args):
+            return node
+        keywords = {kw.arg: kw.value for kw in node.keywords}
+        if "data" in keywords:
+            return node
+        if node.func.attr == "scatter" and any(
+            name in keywords and not isinstance(keywords[name], ast.Constant)
+            for name in ["c", "s"]
+        ):
+            # Per-point colors and sizes would no longer line up
+            return node
+
+        if node.func.attr == "scatter":
+            # scatter(x, y, s, c): sizes and colors given positionally would no
+            # longer line up either
+            if len(node.args) != 2:
+                return node
+            node.args = [self._downsample_group(node.args)]
+            return node
+
+        # Positional arrays come in groups separated by format strings, a group
+        # may hold several x, y pairs as in plt.plot(x, y1, x, y2)
+        new_args = []
+        group = []
+        for arg in node.args + [None]:
+            if arg is None or (
+                isinstance(arg, ast.Constant) and isinstance(arg.value, str)
+            ):
+                if len(group) > 2 and len(group) % 2:
+                    return node
+                if len(group) <= 2:
+                    pairs = [group] if group else []
+                else:
+                    pairs = [group[i : i + 2] for i in range(0, len(group), 2)]
+                new_args += [self._downsample_group(pair) for pair in pairs]
+                group = []
+                if arg is not None:
+                    new_args.append(arg)
+            else:
+                group.append(arg)
+
+        node.args = new_args
+        return node
+
+    def _is_plot_call(self, node):
+        if not (
+            isinstance(node.func, ast.Attribute)
+            and node.func.attr in self.plot_methods
+            and node.args
+        ):
+            return False
+        receiver = node.func.value
+        if isinstance(receiver, ast.Subscript):
+            receiver = receiver.value
+        return isinstance(receiver, ast.Name) and (
+            receiver.id == "plt" or receiver.id in self.axes_vars
+        )
+
+    def _downsample_group(self, group):
+        self.runtime_imports.add(("converter_runtime.downsampling", "downsample"))
+        return ast.Starred(
+            value=ast.Call(
+                func=ast.Name(id="downsample", ctx=ast.Load()),
+                args=group,
+                keywords=[],
+            ),
+            ctx=ast.Load(),
+        )
+
+
+class NativeChartTransformer(ast.NodeTransformer):
+    # Replaces a simple figure (line, scatter and bar calls with titles and
+    # labels, from plt.figure/plt.subplots to the show) by a chart the browser
+    # draws. Anything else stays a rasterised st.pyplot figure.
+    def __init__(self, downsample_plots=False):
+        self.downsample_plots = downsample_plots
+        self.chart_methods = ["plot", "scatter", "bar"]
+        self.chart_keywords = ["label", "color"]
+        self.label_methods = {
+            "title": "title",
+            "set_title": "title",
+            "xlabel": "xlabel",
+            "set_xlabel": "xlabel",
+            "ylabel": "ylabel",
+            "set_ylabel": "ylabel",
+        }
+        # Vega-Lite draws a grid and fits the layout anyway
+        self.ignored_methods = ["grid", "tight_layout"]
+        self.scopes = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)
+        self.runtime_imports = set()
+
+    def visit_Module(self, node):
+        self.parents = {}
+        self.locations = {}
+        self.free_names = set()
+        blocks = []
+        for n in ast.walk(node):
+            for child in ast.iter_child_nodes(n):
+                self.parents[child] = n
+            for field in ["body", "orelse", "finalbody"]:
+                body = getattr(n, field, None)
+                if isinstance(body, list):
+                    for index, statement in enumerate(body):
+                        self.locations[statement] = (body, index)
+                    blocks += [(body, *block) for block in self._find_blocks(body)]
+            if isinstance(n, self.scopes):
+                # Names a function may read from the module
+                self.free_names |= self._loads(n) - self._stores(n)
+
+        # fig and ax used after the chart (fig.savefig(...)) keep their figure
+        blocks = [
+            (body, start, end, chart)
+            for body, start, end, names, chart in blocks
+            if not self._used_later(body, start, end, names)
+        ]
+        for body, start, end, chart in sorted(
+            blocks, key=lambda block: block[1], reverse=True
+        ):
+            body[start:end] = [ast.copy_location(chart, body[start])]
+        if blocks:
+            self.runtime_imports.add(("converter_runtime.charts", "native_chart"))
+        return node
+
+    def _loads(self, node):
+        return {
+            n.id
+            for n in ast.walk(node)
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)
+        }
+
+    def _stores(self, node):
+        return {
+            n.id
+            for n in ast.walk(node)
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)
+        }
+
+    def _used_later(self, body, start, end, names):
+        # Whether a statement run after body[start:end] can read one of names
+        # before it is assigned again
+        block = body[start:end]
+        remaining = set(names)
+        statements = body[end:]
+        holder = self.parents[body[start]]
+        while True:
+            for statement in statements:
+                if self._loads(statement) & remaining:
+                    return True
+                if isinstance(statement, (ast.Assign, ast.AnnAssign)):
+                    remaining -= self._stores(statement)
+                if not remaining:
+                    return False
+            if isinstance(holder, ast.Module):
+                return bool(remaining & self.free_names)
+            if isinstance(holder, self.scopes):
+                return any(
+                    remaining & set(n.names)
+                    for n in ast.walk(holder)
+                    if isinstance(n, ast.Global)
+                )
+            if isinstance(holder, (ast.For, ast.AsyncFor, ast.While)):
+                # The next iteration runs the statements before the block too
+                loop = [n for n in holder.body if n not in block]
+                if any(self._loads(n) & remaining for n in loop):
+                    return True
+            while holder not in self.locations:
+                # except and case clauses
+                holder = self.parents[holder]
+            body, index = self.locations[holder]
+            statements = body[index + 1 :]
+            holder = self.parents[holder]
+
+    def _find_blocks(self, body):
+        # [(start, end, bound names, chart statement)]
+        blocks = []
+        index = 0
+        while index < len(body):
+            block = self._match_block(body, index)
+            if block is None:
+                index += 1
+            else:
+                blocks.append(block)
+                index = block[1]
+        return blocks
+
+    def _match_block(self, body, start):
+        figure = self._figure(body[start])
+        if figure is None:
+            return None
+        fig_var, ax_var, figsize = figure
+        receivers = {"plt", ax_var}
+        layers = []
+        options = {}
+        for end in range(start + 1, len(body)):
+            statement = body[end]
+            if self._is_show(statement, fig_var):
+                if not layers:
+                    return None
+                names = {name for name in [fig_var, ax_var] if name}
+                chart = self._chart(layers, options, figsize)
+                return start, end + 1, names, chart
+            if not (
+                isinstance(statement, ast.Expr)
+                and isinstance(statement.value, ast.Call)
+                and isinstance(statement.value.func, ast.Attribute)
+                and isinstance(statement.value.func.value, ast.Name)
+                and statement.value.func.value.id in receivers
+            ):
+                return None
+            call = statement.value
+            method = call.func.attr
+            if method in self.chart_methods:
+                layer = self._layer(call)
+                if layer is None:
+                    return None
+                layers.append(layer)
+            elif method in self.label_methods:
+                if len(call.args) != 1 or call.keywords:
+                    return None
+                options[self.label_methods[method]] = call.args[0]
+            elif method == "legend":
+                if call.args or call.keywords:
+                    return None
+                options["legend"] = ast.Constant(value=True)
+            elif method in self.ignored_methods:
+                if call.keywords or any(
+                    not (isinstance(arg, ast.Constant) and arg.value is True)
+                    for arg in call.args
+                ):
+                    return None
+            else:
+                return None
+        return None
+
+    def _figure(self, statement):
+        # (fig name, ax name, figsize) for a figure without subplot layout
+        fig_var = ax_var = None
+        if isinstance(statement, ast.Assign) and len(statement.targets) == 1:
+            target = statement.targets[0]
+            call = statement.value
+            if self._is_plt_call(call, "figure") and isinstance(target, ast.Name):
+                fig_var = target.id
+            elif (
+                self._is_plt_call(call, "subplots")
+                and isinstance(target, ast.Tuple)
+                and len(target.elts) == 2
+                and all(isinstance(elt, ast.Name) for elt in target.elts)
+            ):
+                fig_var, ax_var = (elt.id for elt in target.elts)
+            else:
+                return None
+        elif isinstance(statement, ast.Expr) and self._is_plt_call(
+            statement.value, "figure"
+        ):
+            call = statement.value
+        else:
+            return None
+        keywords = {kw.arg: kw.value for kw in call.keywords}
+        if call.args or set(keywords) - {"figsize"}:
+            return None
+        return fig_var, ax_var, keywords.get("figsize")
+
+    def _is_show(self, statement, fig_var):
+        if not isinstance(statement, ast.Expr):
+            return False
+        call = statement.value
+        if self._is_plt_call(call, "show"):
+            return not call.args and not call.keywords
+        return (
+            fig_var is not None
+            and isinstance(call, ast.Call)
+            and isinstance(call.func, ast.Attribute)
+            and call.func.attr == "pyplot"
+            and isinstance(call.func.value, ast.Name)
+            and call.func.value.id == "st"
+            and len(call.args) == 1
+            and isinstance(call.args[0], ast.Name)
+            and call.args[0].id == fig_var
+            and not call.keywords
+        )
+
+    def _layer(self, call):
+        # ("plot", (x, y), {"label": ...}), format strings and styling fall back
+        method = call.func.attr
+        if any(
+            isinstance(arg, ast.Starred)
+            or isinstance(arg, ast.Constant)
+            and isinstance(arg.value, str)
+            for arg in call.args
+        ):
+            return None
+        if len(call.args) not in ([1, 2] if method == "plot" else [2]):
+            return None
+        keywords = {kw.arg: kw.value for kw in call.keywords}
+        if set(keywords) - set(self.chart_keywords):
+            return None
+        if "color" in keywords and not (
+            isinstance(keywords["color"], ast.Constant)
+            and isinstance(keywords["color"].value, str)
+        ):
+            return None
+        return ast.Tuple(
+            elts=[
+                ast.Constant(value=method),
+                ast.Tuple(elts=call.args, ctx=ast.Load()),
+                ast.Dict(
+                    keys=[ast.Constant(value=name) for name in keywords],
+                    values=list(keywords.values()),
+                ),
+            ],
+            ctx=ast.Load(),
+        )
+
+    def _chart(self, layers, options, figsize):
+        keywords = [
+            ast.keyword(arg=name, value=value) for name, value in options.items()
+        ]
+        if figsize is not None:
+            keywords.append(ast.keyword(arg="figsize", value=figsize))
+        if self.downsample_plots:
+            keywords.append(
+                ast.keyword(arg="downsample_plots", value=ast.Constant(value=True))
+            )
+        return ast.Expr(
+            value=ast.Call(
+                func=ast.Name(id="native_chart", ctx=ast.Load()),
+                args=[ast.List(elts=layers, ctx=ast.Load())],
+                keywords=keywords,
+            )
+        )
+
+    def _is_plt_call(self, value, attr):
+        return (
+            isinstance(value, ast.Call)
+            and isinstance(value.func, ast.Attribute)
+            and value.func.attr == attr
+            and isinstance(value.func.value, ast.Name)
+            and value.func.value.id == "plt"
+        )
+
+
+class FigureObjectTransformer(ast.NodeTransformer):
+    # Draws every figure on a matplotlib.figure.Figure held by the code that
+    # made it, so sessions running on different threads never share pyplot's
+    # current figure. A module with pyplot calls that cannot be tied to one
+    # of its figures keeps using pyplot.
+    def __init__(self):
+        self.axes_methods = [
+            "annotate",
+            "arrow",
+            "axhline",
+            "axhspan",
+            "axis",
+            "axvline",
+            "axvspan",
+            "bar",
+            "barh",
+            "boxplot",
+            "errorbar",
+            "fill",
+            "fill_between",
+            "fill_betweenx",
+            "grid",
+            "hexbin",
+            "hist",
+            "hist2d",
+            "hlines",
+            "imshow",
+            "legend",
+            "loglog",
+            "margins",
+            "pcolormesh",
+            "pie",
+            "plot",
+            "scatter",
+            "semilogx",
+            "semilogy",
+            "stackplot",
+            "stairs",
+            "stem",
+            "step",
+            "text",
+            "tick_params",
+            "violinplot",
+            "vlines",
+        ]
+        # plt.title("x") sets, plt.title() gets
+        self.property_methods = [
+            "title",
+            "xlabel",
+            "ylabel",
+            "xlim",
+            "ylim",
+            "xscale",
+            "yscale",
+        ]
+        self.figure_methods = {
+            "clf": "clf",
+            "figlegend": "legend",
+            "figtext": "text",
+            "gca": "gca",
+            "savefig": "savefig",
+            "sca": "sca",
+            "subplot": "add_subplot",
+            "subplots_adjust": "subplots_adjust",
+            "suptitle": "suptitle",
+            "tight_layout": "tight_layout",
+        }
+        # Module-level helpers that do not touch the current figure
+        self.global_functions = [
+            "close",
+            "cycler",
+            "get_cmap",
+            "imread",
+            "ioff",
+            "ion",
+            "Normalize",
+            "rc",
+            "rc_context",
+            "rcdefaults",
+            "setp",
+        ]
+        self.figure_keywords = [
+            "constrained_layout",
+            "dpi",
+            "edgecolor",
+            "facecolor",
+            "figsize",
+            "frameon",
+            "layout",
+            "linewidth",
+            "tight_layout",
+        ]
+        self.subplots_keywords = [
+            "gridspec_kw",
+            "height_ratios",
+            "ncols",
+            "nrows",
+            "sharex",
+            "sharey",
+            "squeeze",
+            "subplot_kw",
+            "width_ratios",
+        ]
+        self.implicit_figure = "_figure"
+        self.scopes = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+        self.current = None
+        self.unsupported = []
+        self.runtime_imports = set()
+
+    def visit_Module(self, node):
+        body = self._rewrite_body(copy.deepcopy(node.body))
+        if self.unsupported:
+            for call in self.unsupported:
+                print(
+                    f"Warning: {ast.unparse(call)} does not belong to a figure, "
+                    "keeping pyplot figures"
+                )
+            self.runtime_imports = set()
+            return node
+        node.body = body
+        return node
+
+    def _rewrite_body(self, body):
+        new_body = []
+        for index, statement in enumerate(body):
+            figure = self._figure_statements(statement)
+            if figure is not None:
+                new_body += [ast.copy_location(n, statement) for n in figure]
+            elif self._is_plt_statement(statement, "show"):
+                if self.current is None:
+                    self.unsupported.append(statement.value)
+                    new_body.append(statement)
+                else:
+                    new_body.append(
+                        ast.copy_location(self._pyplot_call(self.current), statement)
+                    )
+                    # The next drawing call opens a new figure, as after pyplot's
+                    # show
+                    self.current = None
+            elif self._is_pyplot_of(statement, self.current):
+                # plt.show() the widget rewrite already turned into st.pyplot(fig)
+                new_body.append(statement)
+                self.current = None
+            elif self._is_plt_statement(statement, "close"):
+                # Nothing to release, Figure objects are garbage collected
+                continue
+            elif (
+                self.current is None
+                and not isinstance(statement, self.scopes)
+                and self._draws(statement)
+                and any(
+                    self._is_plt_statement(later, "show") for later in body[index + 1 :]
+                )
+            ):
+                # plt.plot(...) ... plt.show() draws on a figure of its own, made
+                # here if the statement draws on it rather than on one it makes
+                self.current = self.implicit_figure
+                rewritten = self._rewrite_statement(statement)
+                if self._uses_name(rewritten, self.implicit_figure):
+                    new_body.append(
+                        ast.copy_location(
+                            self._new_figure(self.implicit_figure, []), statement
+                        )
+                    )
+                else:
+                    self.current = None
+                new_body += rewritten
+            else:
+                new_body += self._rewrite_statement(statement)
+        return new_body
+
+    def _rewrite_statement(self, statement):
+        if isinstance(statement, self.scopes):
+            # The caller's current figure is unknown
+            current = self.current
+            self.current = None
+            statement.body = self._rewrite_body(statement.body)
+            self.current = current
+            return [statement]
+
+        current = self.current
+        for field, value in ast.iter_fields(statement):
+            if isinstance(value, list) and value and isinstance(value[0], ast.stmt):
+                setattr(statement, field, self._rewrite_body(value))
+            elif isinstance(value, list) and value and isinstance(
+                value[0], (ast.excepthandler, ast.match_case)
+            ):
+                for clause in value:
+                    clause.body = self._rewrite_body(clause.body)
+            elif isinstance(value, list):
+                setattr(
+                    statement,
+                    field,
+                    [self.visit(v) if isinstance(v, ast.AST) else v for v in value],
+                )
+            elif isinstance(value, ast.AST):
+                setattr(statement, field, self.visit(value))
+        if self.current != current:
+            # A figure made in a branch or loop may or may not exist afterwards
+            self.current = None
+        return [statement]
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not (
+            isinstance(node.func, ast.Attribute)
+            and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == "plt"
+        ):
+            return node
+        name = node.func.attr
+        if name in self.global_functions:
+            return node
+        if self.current is None:
+            self.unsupported.append(node)
+            return node
+
+        figure = ast.Name(id=self.current, ctx=ast.Load())
+        axes = ast.Call(
+            func=ast.Attribute(value=figure, attr="gca", ctx=ast.Load()),
+            args=[],
+            keywords=[],
+        )
+        if name in self.axes_methods:
+            return self._method_call(axes, name, node)
+        if name in self.property_methods:
+            prefix = "get" if not node.args and not node.keywords else "set"
+            return self._method_call(axes, f"{prefix}_{name}", node)
+        if name in ["xticks", "yticks"]:
+            if node.args:
+                return self._method_call(axes, f"set_{name}", node)
+            if len(node.keywords) == 1 and node.keywords[0].arg == "rotation":
+                # plt.xticks(rotation=45)
+                return ast.Call(
+                    func=ast.Attribute(value=axes, attr="tick_params", ctx=ast.Load()),
+                    args=[],
+                    keywords=[
+                        ast.keyword(arg="axis", value=ast.Constant(value=name[0])),
+                        ast.keyword(
+                            arg="labelrotation", value=node.keywords[0].value
+                        ),
+                    ],
+                )
+        if name in self.figure_methods:
+            return self._method_call(figure, self.figure_methods[name], node)
+        if name == "gcf":
+            return figure
+        if name == "axes":
+            # plt.axes() adds a subplot, plt.axes(rect) an axes at rect
+            method = "add_axes" if node.args else "add_subplot"
+            return self._method_call(figure, method, node)
+        if name == "colorbar" and node.args:
+            return self._method_call(figure, "colorbar", node)
+        self.unsupported.append(node)
+        return node
+
+    def _figure_statements(self, statement):
+        # fig = plt.figure(...), fig, ax = plt.subplots(...) and plt.figure()
+        if isinstance(statement, ast.Expr) and self._is_plt_call(
+            statement.value, "figure"
+        ):
+            target = ast.Name(id=self.implicit_figure, ctx=ast.Store())
+            call = statement.value
+        elif isinstance(statement, ast.Assign) and len(statement.targets) == 1:
+            target, call = statement.targets[0], statement.value
+        else:
+            return None
+
+        if self._is_plt_call(call, "figure") and isinstance(target, ast.Name):
+            if call.args or any(
+                kw.arg not in self.figure_keywords for kw in call.keywords
+            ):
+                self.unsupported.append(call)
+                return None
+            self.current = target.id
+            return [self._new_figure(target.id, call.keywords)]
+
+        if (
+            self._is_plt_call(call, "subplots")
+            and isinstance(target, ast.Tuple)
+            and len(target.elts) == 2
+            and isinstance(target.elts[0], ast.Name)
+        ):
+            figure_keywords = []
+            subplots_keywords = []
+            for kw in call.keywords:
+                if kw.arg in self.figure_keywords:
+                    figure_keywords.append(kw)
+                elif kw.arg in self.subplots_keywords:
+                    subplots_keywords.append(kw)
+                else:
+                    self.unsupported.append(call)
+                    return None
+            fig_var = target.elts[0].id
+            self.current = fig_var
+            subplots = ast.Call(
+                func=ast.Attribute(
+                    value=ast.Name(id=fig_var, ctx=ast.Load()),
+                    attr="subplots",
+                    ctx=ast.Load(),
+                ),
+                args=call.args,
+                keywords=subplots_keywords,
+            )
+            return [
+                self._new_figure(fig_var, figure_keywords),
+                ast.Assign(targets=[target.elts[1]], value=subplots),
+            ]
+        return None
+
+    def _new_figure(self, name, keywords):
+        self.runtime_imports.add(("matplotlib.figure", "Figure"))
+        return ast.Assign(
+            targets=[ast.Name(id=name, ctx=ast.Store())],
+            value=ast.Call(
+                func=ast.Name(id="Figure", ctx=ast.Load()), args=[], keywords=keywords
+            ),
+        )
+
+    def _method_call(self, receiver, method, call):
+        return ast.Call(
+            func=ast.Attribute(value=receiver, attr=method, ctx=ast.Load()),
+            args=call.args,
+            keywords=call.keywords,
+        )
+
+    def _pyplot_call(self, name):
+        self.runtime_imports.add(STREAMLIT_IMPORT)
+        return ast.Expr(
+            value=ast.Call(
+                func=ast.Attribute(
+                    value=ast.Name(id="st", ctx=ast.Load()),
+                    attr="pyplot",
+                    ctx=ast.Load(),
+                ),
+                args=[ast.Name(id=name, ctx=ast.Load())],
+                keywords=[],
+            )
+        )
+
+    def _uses_name(self, statements, name):
+        # Outside nested functions and classes, which have figures of their own
+        nodes = list(statements)
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, ast.Name) and node.id == name:
+                return True
+            if not isinstance(node, self.scopes):
+                nodes.extend(ast.iter_child_nodes(node))
+        return False
+
+    def _draws(self, statement):
+        return any(
+            isinstance(n, ast.Call)
+            and isinstance(n.func, ast.Attribute)
+            and isinstance(n.func.value, ast.Name)
+            and n.func.value.id == "plt"
+            and n.func.attr not in self.global_functions
+            for n in ast.walk(statement)
+        )
+
+    def _is_pyplot_of(self, statement, name):
+        if not isinstance(statement, ast.Expr):
+            return False
+        call = statement.value
+        return (
+            isinstance(call, ast.Call)
+            and isinstance(call.func, ast.Attribute)
+            and call.func.attr == "pyplot"
+            and isinstance(call.func.value, ast.Name)
+            and call.func.value.id == "st"
+            and len(call.args) == 1
+            and isinstance(call.args[0], ast.Name)
+            and call.args[0].id == name
+        )
+
+    def _is_plt_statement(self, statement, attr):
+        return isinstance(statement, ast.Expr) and self._is_plt_call(
+            statement.value, attr
+        )
+
+    def _is_plt_call(self, value, attr):
+        return (
+            isinstance(value, ast.Call)
+            and isinstance(value.func, ast.Attribute)
+            and value.func.attr == attr
+            and isinstance(value.func.value, ast.Name)
+            and value.func.value.id == "plt"
+        )
+
+
+class ProfilingTransformer(ast.NodeTransformer):
+    def __init__(self, cell_starts):
+        self.cell_starts = cell_starts
+        self.runtime_imports = {("converter_runtime", "profiling")}
+
+    def visit_Module(self, node):
+        body = []
+        cell_statements = []
+        cell_number = None
+        for statement in node.body:
+            lineno = getattr(statement, "lineno", None)
+            if lineno and self.cell_starts:
+                cell_number = bisect_right(self.cell_starts, lineno)
+            if isinstance(
+                statement, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.ClassDef)
+            ):
+                # Imports and definitions stay at the top level
+                body += self._wrap_cell(cell_statements)
+                cell_statements = []
+                if isinstance(statement, ast.FunctionDef):
+                    statement = self._instrument_function(statement)
+                body.append(statement)
+            else:
+                if cell_statements and cell_number != cell_statements[-1][0]:
+                    body += self._wrap_cell(cell_statements)
+                    cell_statements = []
+                cell_statements.append((cell_number, statement))
+        body += self._wrap_cell(cell_statements)
+
+        # The imports on top stay at the top level where they can be deduplicated,
+        # the rest is recorded also when it raises or calls st.stop()
+        index = 0
+        imports = (ast.Import, ast.ImportFrom)
+        while index < len(body) and isinstance(body[index], imports):
+            index += 1
+        node.body = body[:index] + [
+            ast.Expr(value=self._profiling_call("start_rerun")),
+            ast.Try(
+                body=body[index:] or [ast.Pass()],
+                handlers=[],
+                orelse=[],
+                finalbody=[ast.Expr(value=self._profiling_call("finish_rerun"))],
+            ),
+        ]
+        return node
+
+    def _wrap_cell(self, cell_statements):
+        if not cell_statements:
+            return []
+        cell_number = cell_statements[0][0]
+        return [
+            ast.With(
+                items=[
+                    ast.withitem(
+                        context_expr=self._profiling_call(
+                            "cell", ast.Constant(value=cell_number or 0)
+                        ),
+                        optional_vars=None,
+                    )
+                ],
+                body=[statement for _, statement in cell_statements],
+            )
+        ]
+
+    def _instrument_function(self, node):
+        # Shallow copy, the same definition can be shared by several pages
+        node = copy.copy(node)
+        label = ast.Constant(value=f"{node.name}()")
+        decorators = list(node.decorator_list)
+        if any(self._is_streamlit_cache(decorator) for decorator in decorators):
+            # The innermost decorator only runs on cache misses
+            decorators.append(self._profiling_call("cache_miss", label))
+        node.decorator_list = [self._profiling_call("function", label)] + decorators
+        return node
+
+    def _is_streamlit_cache(self, decorator):
+        if isinstance(decorator, ast.Call):
+            decorator = decorator.func
+        return (
+            isinstance(decorator, ast.Attribute)
+            and decorator.attr.startswith("cache")
+            and isinstance(decorator.value, ast.Name)
+            and decorator.value.id == "st"
+        )
+
+    def _profiling_call(self, name, *args):
+        return ast.Call(
+            func=ast.Attribute(
+                value=ast.Name(id="profiling", ctx=ast.Load()),
+                attr=name,
+                ctx=ast.Load(),
+            ),
+            args=list(args),
+            keywords=[],
+        )
+
+
+class WarmUpTransformer(ast.NodeTransformer):
+    def __init__(self, interactive_defaults):
+        self.interactive_defaults = interactive_defaults
+        self.runtime_imports = set()
+
+    def visit_Module(self, node):
+        functions = {
+            statement.name: statement
+            for statement in node.body
+            if isinstance(statement, ast.FunctionDef)
+        }
+        widget_names = self._widget_dependent_names(node.body)
+        # Module objects a function changes in place, e.g. results.append(n),
+        # differ from one call (and rerun) to the next
+        module_names = set()
+        for statement in node.body:
+            if not isinstance(
+                statement, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.ClassDef)
+            ):
+                module_names |= self._assigned_names(statement)
+        changed_names = set()
+        for function in functions.values():
+            changed_names |= self._changed_names(function) - self._local_names(
+                function
+            )
+        changed_names &= module_names
+        defaults = {
+            name: values
+            for name, values in self.interactive_defaults.items()
+            if name in functions
+            and self._cacheable(
+                functions[name], widget_names | changed_names, functions
+            )
+        }
+        if not defaults:
+            return node
+
+        for name in defaults:
+            function = functions[name]
+            if not function.decorator_list:
+                function.decorator_list = [self._cache_decorator()]
+
+        # Warm each function up right before its first call, where everything
+        # it reads from the module has been defined
+        body = []
+        warmed = set()
+        for statement in node.body:
+            if not isinstance(
+                statement, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.ClassDef)
+            ):
+                for name in defaults:
+                    if name not in warmed and name in self._called_names(statement):
+                        body.append(self._warm_up_call(name))
+                        warmed.add(name)
+            body.append(statement)
+
+        index = 0
+        while index < len(body) and isinstance(
+            body[index], (ast.Import, ast.ImportFrom)
+        ):
+            index += 1
+        body.insert(
+            index,
+            ast.Assign(
+                targets=[ast.Name(id="WARM_UP_DEFAULTS", ctx=ast.Store())],
+                value=ast.parse(repr(defaults), mode="eval").body,
+            ),
+        )
+        node.body = body
+        self.runtime_imports.add(("converter_runtime.warm_up", "warm_up"))
+        return node
+
+    def _is_widget_read(self, node):
+        # st.slider(...), st.sidebar.slider(...) and st.session_state
+        while isinstance(node, ast.Call):
+            node = node.func
+        if not isinstance(node, ast.Attribute):
+            return False
+        if node.attr not in STREAMLIT_WIDGETS + ["session_state"]:
+            return False
+        while isinstance(node, ast.Attribute):
+            node = node.value
+        return isinstance(node, ast.Name) and node.id == "st"
+
+    def _assigned_names(self, statement):
+        names = set()
+        for node in ast.walk(statement):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                names.add(node.id)
+            elif isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(
+                node.ctx, ast.Store
+            ):
+                base = node
+                while isinstance(base, (ast.Subscript, ast.Attribute)):
+                    base = base.value
+                if isinstance(base, ast.Name):
+                    names.add(base.id)
+        return names
+
+    def _widget_dependent_names(self, body):
+        names = set()
+        for statement in body:
+            if isinstance(statement, (ast.FunctionDef, ast.ClassDef)):
+                continue
+            if any(map(self._is_widget_read, ast.walk(statement))) or any(
+                isinstance(n, ast.Name) and n.id in names for n in ast.walk(statement)
+            ):
+                names |= self._assigned_names(statement)
+        return names
+
+    def _cacheable(self, function, changing_names, functions):
+        # A cache hit skips the body, so the result may only depend on the
+        # arguments: no widgets, no session state, no random numbers, no
+        # globals the visitor or a function changes. The same goes for the
+        # module functions it calls, record(n) appending to a list included.
+        if function.decorator_list and not all(
+            self._is_streamlit_cache(decorator) for decorator in function.decorator_list
+        ):
+            return False
+        for reached in self._reachable(function, functions):
+            nodes = list(ast.walk(reached))
+            if any(isinstance(n, (ast.Global, ast.Nonlocal)) for n in nodes):
+                return False
+            if any(map(self._is_widget_read, nodes)):
+                return False
+            if self._draws_random(nodes):
+                return False
+            read = {
+                n.id
+                for n in nodes
+                if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)
+            }
+            if (read - self._local_names(reached)) & changing_names:
+                return False
+        return True
+
+    def _reachable(self, function, functions):
+        # The function and the module functions it calls, directly or not
+        reached = {function.name: function}
+        pending = [function]
+        while pending:
+            for name in self._called_names(pending.pop()):
+                if name in functions and name not in reached:
+                    reached[name] = functions[name]
+                    pending.append(functions[name])
+        return list(reached.values())
+
+    def _draws_random(self, nodes):
+        # np.random.rand(3), random.choice(...) and rng.random() draw new
+        # numbers on every call, unless the function seeds them first with
+        # np.random.seed(1) or np.random.default_rng(0)
+        calls = [node for node in nodes if self._is_random_call(node)]
+        seeded = any(
+            call.args
+            and isinstance(call.func, ast.Attribute)
+            and call.func.attr in ["seed", "default_rng", "RandomState"]
+            for call in calls
+        )
+        return bool(calls) and not seeded
+
+    def _is_random_call(self, node):
+        if not isinstance(node, ast.Call):
+            return False
+        func = node.func
+        while isinstance(func, ast.Attribute):
+            if func.attr == "random":
+                return True
+            func = func.value
+        return isinstance(func, ast.Name) and func.id == "random"
+
+    def _local_names(self, function):
+        # Names bound by plain assignment or as parameters, a store into a
+        # subscript or attribute changes the object the name already holds
+        return {
+            n.id
+            for n in ast.walk(function)
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)
+        } | {
+            argument.arg
+            for argument in ast.walk(function.args)
+            if isinstance(argument, ast.arg)
+        }
+
+    def _changed_names(self, function):
+        # Base names of subscript and attribute stores, augmented assignments
+        # and method calls
+        names = set()
+        for node in ast.walk(function):
+            if isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(
+                node.ctx, (ast.Store, ast.Del)
+            ):
+                base = node
+            elif isinstance(node, ast.AugAssign):
+                base = node.target
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+                base = node.func.value
+            else:
+                continue
+            while isinstance(base, (ast.Subscript, ast.Attribute, ast.Call)):
+                base = base.func if isinstance(base, ast.Call) else base.value
+            if isinstance(base, ast.Name):
+                names.add(base.id)
+        return names
+
+    def _is_streamlit_cache(self, decorator):
+        if isinstance(decorator, ast.Call):
+            decorator = decorator.func
+        return (
+            isinstance(decorator, ast.Attribute)
+            and decorator.attr.startswith("cache")
+            and isinstance(decorator.value, ast.Name)
+            and decorator.value.id == "st"
+        )
+
+    def _called_names(self, statement):
+        return {
+            n.func.id
+            for n in ast.walk(statement)
+            if isinstance(n, ast.Call) and isinstance(n.func, ast.Name)
+        }
+
+    def _cache_decorator(self):
+        return ast.Call(
+            func=ast.Attribute(
+                value=ast.Name(id="st", ctx=ast.Load()),
+                attr="cache_data",
+                ctx=ast.Load(),
+            ),
+            args=[],
+            keywords=[ast.keyword(arg="show_spinner", value=ast.Constant(value=False))],
+        )
+
+    def _warm_up_call(self, name):
+        defaults = ast.Subscript(
+            value=ast.Name(id="WARM_UP_DEFAULTS", ctx=ast.Load()),
+            slice=ast.Index(value=ast.Str(s=name)),
+            ctx=ast.Load(),
+        )
+        return ast.Expr(
+            value=ast.Call(
+                func=ast.Name(id="warm_up", ctx=ast.Load()),
+                args=[ast.Name(id=name, ctx=ast.Load()), ast.Str(s=name), defaults],
+                keywords=[],
+            )
+        )
@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.parse
+from pathlib import Path
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from tornado.httpclient import HTTPClientError
+from tornado.websocket import websocket_connect
+
+from converter_runtime.warm_up import QUERY_PARAMETER, SECRET_PARAMETER, SECRET_VARIABLE
+
+STREAM_PATH = "_stcore/stream"
+
+
+def stream_url(app_url):
+    parts = urllib.parse.urlsplit(app_url)
+    scheme = "wss" if parts.scheme == "https" else "ws"
+    path = parts.path.rstrip("/") + "/" + STREAM_PATH
+    return urllib.parse.urlunsplit((scheme, parts.netloc, path, "", ""))
+
+
+async def run_page(connection, query_string, page_script_hash=""):
+    # One script run in the app's own process, as a browser would trigger it.
+    # Returns the app pages and the messages of exceptions the script showed.
+    message = BackMsg()
+    message.rerun_script.query_string = query_string
+    message.rerun_script.page_script_hash = page_script_hash
+    await connection.write_message(message.SerializeToString(), binary=True)
+
+    pages = []
+    errors = []
+    while True:
+        data = await connection.read_message()
+        if data is None:
+            raise ConnectionError("The app closed the connection")
+        forward = ForwardMsg()
+        forward.ParseFromString(data)
+        kind = forward.WhichOneof("type")
+        if kind == "new_session":
+            pages = list(forward.new_session.app_pages)
+        elif kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+            element = forward.delta.new_element
+            if element.WhichOneof("type") == "exception":
+                errors.append(element.exception.message)
+        elif kind == "script_finished":
+            if forward.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                errors.append("the script does not compile")
+            return pages, errors
+
+
+async def warm_up(app_url, grid, secret, page_names=None):
+    query_string = urllib.parse.urlencode(
+        {QUERY_PARAMETER: json.dumps(grid), SECRET_PARAMETER: secret}
+    )
+    connection = await websocket_connect(stream_url(app_url))
+    results = []
+    try:
+        start = time.perf_counter()
+        pages, errors = await run_page(connection, query_string)
+        main_page = pages[0].page_name if pages else "main"
+        if page_names is None or main_page in page_names:
+            results.append((main_page, time.perf_counter() - start, errors))
+        for page in pages[1:]:
+            if page_names is not None and page.page_name not in page_names:
+                continue
+            start = time.perf_counter()
+            _, errors = await run_page(connection, query_string, page.page_script_hash)
+            results.append((page.page_name, time.perf_counter() - start, errors))
+    finally:
+        connection.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fill a running app's caches for the default widget values"
+    )
+    parser.add_argument("app_url", help="e.g. http://localhost:8501")
+    parser.add_argument(
+        "--grid",
+        help='JSON file like {"function": {"parameter": [values]}}, each '
+        "combination is computed with the other parameters at their defaults",
+    )
+    parser.add_argument(
+        "--page", action="append", help="Only warm up these pages, repeatable"
+    )
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    # The app only warms up for a session that knows its secret
+    secret = os.environ.get(SECRET_VARIABLE)
+    if not secret:
+        print(
+            f"Set {SECRET_VARIABLE} to the value the app was started with",
+            file=sys.stderr,
+        )
+        sys.exit(2)
+
+    grid = json.loads(Path(args.grid).read_text()) if args.grid else {}
+    try:
+        results = asyncio.run(
+            asyncio.wait_for(
+                warm_up(args.app_url, grid, secret, args.page), args.timeout
+            )
+        )
+    except (OSError, HTTPClientError, asyncio.TimeoutError) as error:
+        print(f"Warm-up of {args.app_url} failed: {error!r}", file=sys.stderr)
+        sys.exit(1)
+
+    failed = False
+    for page_name, seconds, errors in results:
+        print(f"{page_name}: {seconds * 1000:.0f} ms")
+        for error in errors:
+            failed = True
+            print(f"  {error}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
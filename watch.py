@@ -0,0 +1,191 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Imported once, every later conversion reuses the loaded exporter and transformers
+from converter import convert
+
+INDEX_VERSION = 1
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # mkstemp creates owner-only files
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def load_index(index_path, convert_options):
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    # Outputs made with other options are stale
+    if index.get("version") != INDEX_VERSION or index["options"] != convert_options:
+        return {}
+    return index["notebooks"]
+
+
+def save_index(index_path, convert_options, notebooks):
+    index = {
+        "version": INDEX_VERSION,
+        "options": convert_options,
+        "notebooks": notebooks,
+    }
+    write_atomic(index_path, json.dumps(index, indent=1).encode("utf-8"))
+
+
+class Watcher:
+    def __init__(self, notebook_dir, output_dir, index_path, convert_options):
+        self.notebook_dir = Path(notebook_dir)
+        self.output_dir = Path(output_dir)
+        self.index_path = Path(index_path)
+        self.convert_options = convert_options
+        self.notebooks = load_index(self.index_path, convert_options)
+
+    def save(self):
+        save_index(self.index_path, self.convert_options, self.notebooks)
+
+    def output_path(self, notebook):
+        relative = notebook.relative_to(self.notebook_dir)
+        return self.output_dir / relative.with_suffix(".py")
+
+    def poll(self):
+        converted = 0
+        seen = set()
+        for notebook in sorted(self.notebook_dir.rglob("*.ipynb")):
+            if ".ipynb_checkpoints" in notebook.parts:
+                continue
+            key = str(notebook.relative_to(self.notebook_dir))
+            seen.add(key)
+            try:
+                if self.check(notebook, key):
+                    converted += 1
+            except OSError as e:
+                # Notebook removed or half-written between listing and reading
+                print(f"Warning: could not read {notebook}: {e}", file=sys.stderr)
+
+        removed = set(self.notebooks) - seen
+        for key in removed:
+            del self.notebooks[key]
+        if converted or removed:
+            self.save()
+        return converted
+
+    def check(self, notebook, key):
+        stat = notebook.stat()
+        entry = self.notebooks.get(key)
+        output = self.output_path(notebook)
+        if (
+            entry
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+            and (entry["output_hash"] is None or output.exists())
+        ):
+            return False
+
+        data = notebook.read_bytes()
+        digest = content_hash(data)
+        if entry and entry["content_hash"] == digest and output.exists():
+            # Touched but not edited, only refresh the stat fields
+            entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            self.save()
+            return False
+
+        started = time.perf_counter()
+        try:
+            output_code = convert(data.decode("utf-8"), **self.convert_options)
+        except Exception as e:
+            # Remember the failure so the same content is not retried
+            print(f"Error converting {notebook}: {e}", file=sys.stderr)
+            output_hash = None
+        else:
+            output_data = output_code.encode("utf-8")
+            output_hash = content_hash(output_data)
+            if not (
+                entry and entry["output_hash"] == output_hash and output.exists()
+            ):
+                write_atomic(output, output_data)
+            print(
+                f"Converted {key} -> {output} "
+                f"in {time.perf_counter() - started:.2f}s",
+                flush=True,
+            )
+
+        self.notebooks[key] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "content_hash": digest,
+            "output_hash": output_hash,
+        }
+        return True
+
+    def run(self, interval):
+        while True:
+            self.poll()
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Watch a notebook directory and convert changed notebooks"
+    )
+    parser.add_argument("notebook_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument(
+        "--index",
+        help="Index file, defaults to .converter-index.json in the output directory",
+    )
+    parser.add_argument("--interval", type=float, default=2.0)
+    parser.add_argument(
+        "--once", action="store_true", help="Convert changed notebooks and exit"
+    )
+    parser.add_argument("--downsample-plots", action="store_true")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--resize-images", action="store_true")
+    parser.add_argument("--warm-up", action="store_true")
+    parser.add_argument("--native-charts", action="store_true")
+    parser.add_argument("--figure-objects", action="store_true")
+    args = parser.parse_args()
+
+    watcher = Watcher(
+        args.notebook_dir,
+        args.output_dir,
+        args.index or Path(args.output_dir) / ".converter-index.json",
+        {
+            "downsample_plots": args.downsample_plots,
+            "profile": args.profile,
+            "resize_images": args.resize_images,
+            "warm_up": args.warm_up,
+            "native_charts": args.native_charts,
+            "figure_objects": args.figure_objects,
+        },
+    )
+    if args.once:
+        watcher.poll()
+        return
+    try:
+        watcher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()